@@ -5,20 +5,29 @@
 # extract some information about plume and trajectories.
 # ===========================================================
 
+import io
 import os
+import re
 import csv
-import folium
+import time
+import logging
+import shutil
+import multiprocessing
 import numpy as np
 import pandas as pd
 import xarray as xr
-import matplotlib as mpl
-import cartopy.crs as ccrs
-import matplotlib.pyplot as plt
 
-from seaborn import set_style
-from dask.diagnostics import ProgressBar
-from matplotlib.backends.backend_pdf import PdfPages
-from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
+from netCDF4 import Dataset, num2date, date2num
+from itertools import repeat
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+# The plotting libraries (matplotlib, cartopy, seaborn, folium) and
+# dask.diagnostics are imported by the methods using them, so the
+# data handling starts fast and works without them installed.
+
+# Progress and stage timings. To see them on screen use
+# logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 class FLEXPARTOutput():
@@ -32,87 +41,386 @@ class FLEXPARTOutput():
     backwards simulations. Funny stuff may happen
     when applied on forward output. Please check 
     results carefully.
+
+    Loading and processing stages are timed (see 'stage') and
+    reported through the 'FLEXPARTOutput' logger and, if given,
+    the 'metrics' callable.
     """
 
-    def __init__(self, outputDir):
+    # Name of the file caching the plume summed over releases
+    plumeCacheName = 'plumeTotal_cache.nc'
+    # Dask chunks for data stored without chunks (and for Zarr
+    # output): one lat/lon slab per time and height
+    ncChunks = {'time': 1, 'height': 1, 'pointspec': 'auto'}
+
+    def __init__(self, outputDir, metrics=None, peakMemory=False):
         """
         Initialize the class attributes
+
+        'metrics' is an optional callable receiving the dict of
+        every stage measured (see 'stage'). With 'peakMemory' the
+        peak memory of every stage is measured too.
         """
         # FLEXPART output directory
         self.outputDir = outputDir
+        self.metrics = metrics
+        self.peakMemory = peakMemory
+        # Peak memory of the stages being measured, outermost first
+        self.stagePeaks = []
         # Initialize variables
         self.trajFiles = None
         self.trajFilesMeta = None
         self.trajData = None
         self.trajDataMeta = None
+        self.trajIndex = None
+        self.trajRanges = None
         self.ncFiles = None
         self.ncData = None
+        self.ncTotal = None
+        self.ncCoords = None
+        self.ncLazy = None
+        self.partFiles = None
+        self.recFile = None
+        self.recData = None
+        self.header = None
+        self.headers = {}
+        self.baseMaps = {}
+        self.plumeNorms = {}
 
-    def load_netcdf(self, outputDir=None):
+    @contextmanager
+    def stage(self, name, **info):
+        """
+        Measure a processing stage, used as:
+            with self.stage('read', method='load_grid',
+                            sizeOnDisk=lambda: disk_size(path)) as info:
+                ...
+                info['rows'] = len(df)
+
+        On exit 'info' gets the 'stage' name and the elapsed
+        'seconds'. Values given as callables are only computed
+        then. It is logged at INFO level and passed to the
+        'metrics' callable.
+
+        If 'peakMemory' is set, 'peakMB' is the peak resident
+        memory of the process during the stage (Linux only, None
+        elsewhere). It is measured by resetting the peak of the
+        whole process ('VmHWM' in /proc/self/status) at the start
+        of every stage, which other tools watching it would see.
+
+        Nothing is measured or computed when there is no
+        'metrics' and the INFO level of the logger is disabled.
+        """
+        if self.metrics is None and not logger.isEnabledFor(logging.INFO):
+            yield info
+            return
+        if self.peakMemory:
+            # Note down the peak of the enclosing stage before resetting
+            if self.stagePeaks:
+                self.stagePeaks[-1] = max(self.stagePeaks[-1],
+                                          peak_memory() or 0)
+            reset_peak_memory()
+            self.stagePeaks.append(0)
+        t0 = time.perf_counter()
+        try:
+            yield info
+        finally:
+            peak = self.stagePeaks.pop() if self.peakMemory else None
+        seconds = time.perf_counter()-t0
+        current = peak_memory() if self.peakMemory else None
+        if current is None:
+            peak = None
+        else:
+            peak = max(peak, current)
+            if self.stagePeaks:
+                self.stagePeaks[-1] = max(self.stagePeaks[-1], peak)
+        info = {'stage': name,
+                **{k: v() if callable(v) else v for k, v in info.items()},
+                'seconds': seconds, 'peakMB': peak}
+        if logger.isEnabledFor(logging.INFO):
+            details = [f'{k}={v}' for k, v in info.items()
+                       if k not in ('stage', 'seconds', 'peakMB')]
+            if peak is not None:
+                details.insert(0, f'peak {peak} MB')
+            logger.info(f' [{name}] {seconds:.3f} s, '
+                        + ', '.join(details))
+        if self.metrics is not None:
+            self.metrics(info)
+
+    def load_netcdf(self, outputDir=None, chunks=None):
         """
         Handles the extraction of netcdf data from
-        the given file or files.
+        the given file or files. Zarr stores ('.zarr') written by
+        the processing methods are found as well.
+
+        The data is opened lazily, see 'extract_nc' for the
+        meaning of 'chunks'.
+
+        A single file is also kept in 'ncLazy' without dask. Indexing
+        it reads from disk only the cells selected, which is faster
+        to extract single frames or a few releases.
         """
         # Save outputDir
         if not outputDir:
             outputDir = self.outputDir
         # Check for nc files
-        print("\nLooking for netCDF4 file... ")
-        files_all = os.listdir(outputDir)
-        files = [f for f in files_all if f.endswith('.nc') == True]
-        files.sort()
-        # If there is one file, save the information
-        if len(files) == 1:
-            self.ncFiles = outputDir+files[0]
-            self.ncData = self.extract_nc(self.ncFiles)
-        # IF there is no files, say it
-        elif len(files) == 0:
-            raise FileNotFoundError('No netCDF files found. Check '
-                                    + 'directory and file extensions.')
-        else:
-            self.ncFiles = [outputDir+f for f in files]
-            self.ncData = self.extract_nc(self.ncFiles)
+        logger.info("Looking for netCDF4 file... ")
+        with self.stage('discovery', method='load_netcdf') as info:
+            files_all = os.listdir(outputDir)
+            # Trajectories may be saved as Zarr in the same directory
+            files = [f for f in files_all if f.endswith(('.nc', '.zarr'))
+                     and f != self.plumeCacheName
+                     and not f.startswith('traj')]
+            files.sort()
+            info['files'] = len(files)
+        # Any cached plume belongs to the previous data
+        if self.ncTotal is not None:
+            self.ncTotal.close()
+            self.ncTotal = None
+        with self.stage('open', method='load_netcdf') as info:
+            # If there is one file, save the information
+            if len(files) == 1:
+                self.ncFiles = outputDir+files[0]
+                self.ncData = self.extract_nc(self.ncFiles, chunks=chunks)
+            # IF there is no files, say it
+            elif len(files) == 0:
+                raise FileNotFoundError('No netCDF files found. Check '
+                                        + 'directory and file extensions.')
+            else:
+                self.ncFiles = [outputDir+f for f in files]
+                self.ncData = self.extract_nc(self.ncFiles, chunks=chunks)
+            # Read the coordinates once for every later lookup
+            self.ncCoords = self.index_coords(self.ncData)
+            # Keep an indexable copy of single files for frames
+            self.ncLazy = None
+            if type(self.ncFiles) != list:
+                if self.ncFiles.endswith('.zarr'):
+                    self.ncLazy = xr.open_zarr(self.ncFiles, chunks=None)
+                else:
+                    self.ncLazy = xr.open_dataset(self.ncFiles)
+                self.ncLazy = self.ncLazy['spec001_mr']
+            info['sizeOnDisk'] = lambda: sum(disk_size(outputDir+f)
+                                             for f in files)
         # Show success message
-        print(' netCDF data succesfully extracted.')
+        logger.info(' netCDF data succesfully extracted.')
 
-    def load_trajectories(self, outputDir=None):
+    def load_trajectories(self, outputDir=None, releases=None,
+                          columns=None):
         """
         Handles the extraction of trajectories data from
         the given file or files.
+
+        For processed trajectories ('combine_trajectories') the
+        data can be restricted to a list of 'releases' and of
+        'columns' (release 'j' is always included). With parquet
+        files only those are read.
         """
         # Save outputDir
         if not outputDir:
             outputDir = self.outputDir
         # Check for trajectories file
-        print("\nLooking for trajectories file... ")
-        files_all = os.listdir(outputDir)
-        files = [f for f in files_all if f.startswith('traj') == True]
-        files.sort()
-        # If there is one file, save the information
-        if len(files) == 1:
-            self.trajFiles = outputDir+files[0]
-            self.trajData, self.trajDataMeta = self.extract_traj()
-        # If there are two files check for data and metadata
-        elif len(files) == 2:
-            # The last part before the dot should be 'data'
-            if files[0].split('.')[0].split('_')[1] == 'data':
-                self.trajFiles = files[0]
-                self.trajData = pd.read_csv(f'{outputDir}/{files[0]}')
-            else:
-                raise FileNotFoundError(f'Unexpected file: {files[0]}')
-            # The last part before the dot should be 'metaData'
-            if files[1].split('.')[0].split('_')[1] == 'metaData':
-                self.trajFilesMeta = files[1]
-                self.trajDataMeta = pd.read_csv(f'{outputDir}/{files[1]}')
+        logger.info("Looking for trajectories file... ")
+        with self.stage('discovery', method='load_trajectories') as info:
+            files_all = os.listdir(outputDir)
+            files = [f for f in files_all if f.startswith('traj') == True]
+            files.sort()
+            info['files'] = len(files)
+        with self.stage('read', method='load_trajectories') as info:
+            # If there is one file, save the information
+            if len(files) == 1:
+                self.trajFiles = outputDir+files[0]
+                self.trajData, self.trajDataMeta = self.extract_traj()
+            # If there are two files check for data and metadata
+            elif len(files) == 2:
+                # The last part before the dot should be 'data'
+                if files[0].split('.')[0].split('_')[1] == 'data':
+                    self.trajFiles = files[0]
+                    self.trajData = self.read_table(
+                        f'{outputDir}/{files[0]}', releases=releases,
+                        columns=columns)
+                else:
+                    raise FileNotFoundError(f'Unexpected file: {files[0]}')
+                # The last part before the dot should be 'metaData'
+                if files[1].split('.')[0].split('_')[1] == 'metaData':
+                    self.trajFilesMeta = files[1]
+                    self.trajDataMeta = self.read_table(
+                        f'{outputDir}/{files[1]}', releases=releases)
+                else:
+                    raise FileNotFoundError(f'Unexpected file: {files[1]}')
+            # If there is no file or more than one, say it.
+            elif len(files) == 0:
+                raise FileNotFoundError('No files found')
             else:
-                raise FileNotFoundError(f'Unexpected file: {files[1]}')
-        # If there is no file or more than one, say it.
-        elif len(files) == 0:
-            raise FileNotFoundError('No files found')
-        else:
-            raise RuntimeError('More than two files found. Check output.')
+                raise RuntimeError('More than two files found. '
+                                   + 'Check output.')
+            info['sizeOnDisk'] = lambda: sum(
+                disk_size(f'{outputDir}/{f}') for f in files)
+            info['rows'] = len(self.trajData)
+        # Index the rows of every release
+        with self.stage('index', method='load_trajectories'):
+            self.trajData, self.trajIndex = self.index_releases(
+                self.trajData)
+            self.trajRanges = None
         # Show success message
-        print(' Trajectories succesfully extracted.')
+        logger.info(' Trajectories succesfully extracted.')
+
+    def load_partposit(self, outputDir=None):
+        """
+        Handles the extraction of particles positions from
+        the 'partposit_*' files found in the output directory.
+
+        The files are saved in 'partFiles', a Series of paths
+        indexed by date and sorted in time. The dumps are mapped
+        only when used (see 'get_partposit'), so runs with
+        thousands of dumps do not keep thousands of files open.
+        """
+        # Save outputDir
+        if not outputDir:
+            outputDir = self.outputDir
+        # Check for partposit files
+        logger.info("Looking for partposit files... ")
+        with self.stage('discovery', method='load_partposit') as info:
+            files_all = os.listdir(outputDir)
+            files = [f for f in files_all if f.startswith('partposit_')
+                     and not f.endswith('.nc')]
+            files.sort()
+            info['files'] = len(files)
+        # If there is no files, say it
+        if len(files) == 0:
+            raise FileNotFoundError('No partposit files found. Check '
+                                    + 'directory and file names.')
+        # Save the information
+        dates = pd.to_datetime([f.split('_')[-1] for f in files],
+                               format='%Y%m%d%H%M%S')
+        self.partFiles = pd.Series([outputDir+f for f in files],
+                                   index=dates)
+        # Show success message
+        logger.info(f' Particles positions succesfully found '
+                    + f'({len(files)} files).')
+
+    def get_partposit(self, date):
+        """
+        Return the particles of the dump at 'date' as a structured
+        array memory-mapped on the file (see 'extract_partposit').
+        The file is only kept open while the array is in use.
+        """
+        if self.partFiles is None:
+            self.load_partposit()
+        date = pd.to_datetime(date)
+        if date not in self.partFiles.index:
+            raise FileNotFoundError(f'No partposit dump for {date}.')
+        return self.extract_partposit(self.partFiles[date])
+
+    def load_header(self, outputDir=None):
+        """
+        Handles the extraction of the binary 'header' file and the
+        '*.namelist' files of the output directory (see
+        'extract_header' and 'extract_namelist').
+
+        The result is saved in 'header' and returned. It is kept
+        per output directory in 'headers', so later calls do not
+        read the files again unless the header has changed.
+        """
+        # Save outputDir
+        if not outputDir:
+            outputDir = self.outputDir
+        # Check for the header file
+        logger.info("Looking for header file... ")
+        headerFile = outputDir+'header'
+        if not os.path.exists(headerFile):
+            raise FileNotFoundError('No header file found. Check '
+                                    + 'directory.')
+        # Reuse the header already read if it did not change
+        key = os.path.abspath(outputDir)
+        mtime = os.path.getmtime(headerFile)
+        if key not in self.headers or self.headers[key][0] != mtime:
+            header = self.extract_header(headerFile)
+            # Add the namelists written by FLEXPART
+            files = sorted(f for f in os.listdir(outputDir)
+                           if f.endswith('.namelist'))
+            header['namelists'] = {
+                f.split('.')[0]: self.extract_namelist(outputDir+f)
+                for f in files}
+            self.headers[key] = (mtime, header)
+        self.header = self.headers[key][1]
+        # Show success message
+        logger.info(' Header succesfully extracted.')
+        return self.header
+
+    def load_grid(self, outputDir=None):
+        """
+        Handles the extraction of the binary (sparse) output
+        files 'grid_conc_*' or 'grid_time_*', for runs without
+        netCDF output.
+
+        The data is saved in 'ncData' as a 'spec001_mr' DataArray
+        like the one of 'load_netcdf', so the same plotting
+        methods can be used. The whole dataset, with deposition
+        and other species, is returned.
+        """
+        # Save outputDir
+        if not outputDir:
+            outputDir = self.outputDir
+        # The grid geometry comes from the header
+        header = self.load_header(outputDir)
+        # Check for grid files
+        logger.info("Looking for binary grid files... ")
+        with self.stage('discovery', method='load_grid') as info:
+            files_all = os.listdir(outputDir)
+            files = [f for f in files_all
+                     if f.startswith(('grid_conc_', 'grid_time_'))
+                     and f.split('_')[2].isdigit()]
+            files.sort()
+            info['files'] = len(files)
+        # If there is no files, say it
+        if len(files) == 0:
+            raise FileNotFoundError('No binary grid files found. Check '
+                                    + 'directory and file names.')
+        # Any cached plume belongs to the previous data
+        if self.ncTotal is not None:
+            self.ncTotal.close()
+            self.ncTotal = None
+        # Save the information
+        self.ncFiles = [outputDir+f for f in files]
+        with self.stage('read', method='load_grid',
+                        sizeOnDisk=lambda: sum(disk_size(f)
+                                               for f in self.ncFiles)):
+            dataset = self.extract_grid(self.ncFiles, header)
+            self.ncData = dataset['spec001_mr']
+            self.ncCoords = self.index_coords(self.ncData)
+            self.ncLazy = None
+        # Show success message
+        logger.info(f' Binary grid data succesfully extracted '
+                    + f'({len(files)} files).')
+        return dataset
+
+    def load_receptors(self, outputDir=None, fileName='receptor_conc'):
+        """
+        Handles the extraction of the values at the receptors
+        ('receptor_conc', or 'receptor_pptv' for mixing ratios)
+        of the output directory (see 'extract_receptors'). The
+        header is read as well for the dates and species.
+
+        The result is saved in 'recData' and returned. It is
+        loaded on first use by 'get_receptor_series'.
+        """
+        # Save outputDir
+        if not outputDir:
+            outputDir = self.outputDir
+        # The dates and the species come from the header
+        header = self.load_header(outputDir)
+        # Check for the receptors file
+        logger.info("Looking for receptors file... ")
+        recFile = outputDir+fileName
+        if not os.path.exists(recFile):
+            raise FileNotFoundError('No receptors file found. Check '
+                                    + 'directory and file name.')
+        self.recFile = recFile
+        self.recData = self.extract_receptors(recFile, header)
+        # Show success message
+        logger.info(f' Receptors succesfully extracted '
+                    + f'({self.recData.sizes["receptor"]} receptors, '
+                    + f'{self.recData.sizes["time"]} times).')
+        return self.recData
 
     def extract_traj(self, trajFile=None):
         '''
@@ -127,8 +435,8 @@ class FLEXPARTOutput():
             trajFile = self.trajFiles
         # Read the file to know metada number of rows and end date
         with open(trajFile, 'r') as f:
-            # Extract the first three rows of the file
-            header = list(csv.reader(f))[:3]
+            # Extract the first three rows of the file only
+            header = list(csv.reader([f.readline() for i in range(3)]))
             # Extract the date and the hour of the end of simulation
             endDate = header[0][0].split(' ')[0].zfill(8)
             endHour = header[0][0].split(' ')[1].zfill(6)
@@ -244,39 +552,432 @@ class FLEXPARTOutput():
             names += [s+f'_{i+1}' for s in names_cluster]
 
         # == Extract the data ===================================
-        # Call read_csv
-        df = pd.read_csv(trajFile, engine='python', sep='\s+',
-                         skiprows=metaRows+3, header=None, names=names)
-        # Extract releases number
-        releases = df['j'].unique()
-        # Iterate over each realease
-        df_list = []
-        for release in releases:
-            # Create a temporal dataframe for the current release
-            df_temp = df[df['j'] == release]
-            # Extract the release date for the current release
-            release_date = df_meta[df_meta['j'] == release]['Date'].values
-            # Add the date to those releases
-            df_temp['Date'] = release_date + \
-                pd.to_timedelta(df_temp['t'].astype(int), 'S').values
-            # Save the positions
-            df_list.append(df_temp)
-        # Concatenate the dataframes
-        df = pd.concat(df_list, ignore_index=True)
+        with self.stage('parse', method='extract_traj_data') as info:
+            # Call read_csv with the C engine, all columns are numeric
+            df = pd.read_csv(trajFile, engine='c', sep=r'\s+',
+                             skiprows=metaRows+3, header=None, names=names)
+            # Group the rows by release keeping their order of appearance
+            codes = pd.factorize(df['j'])[0]
+            order = np.argsort(codes, kind='stable')
+            df = df.iloc[order].reset_index(drop=True)
+            info['rows'] = len(df)
+        with self.stage('dates', method='extract_traj_data'):
+            # Join the release dates with every row at once
+            release_dates = df_meta.set_index('j')['Date']
+            df['Date'] = df['j'].map(release_dates) + \
+                pd.to_timedelta(df['t'].astype(int), 'S')
         # return the data
         return df
 
-    def combine_trajectories(self, runDirs, saveDir):
+    def extract_partposit(self, partFile):
+        """
+        Memory-map a 'partposit_*' Fortran unformatted file and
+        return the particles as a structured array. No data is
+        copied, fields are views on the file ('data['xlon']').
+
+        The file has one record with the time of the dump and
+        then one record per particle, ending with a record where
+        'npoint' is -99999. Every record is enclosed by two 4-byte
+        markers with its length in bytes.
+
+        Fields provided per particle:
+        npoint      Release point the particle belongs to
+        xlon        Longitude of the particle
+        ylat        Latitude of the particle
+        z           Height of the particle (m above ground)
+        itramem     Release time of the particle (s)
+        topo        Topography below the particle
+        pv          Potential vorticity
+        qv          Specific humidity
+        rho         Air density
+        hmix        Mixing height
+        tr          Tropopause height
+        tt          Temperature
+        xmass       Mass of the particle for each species
+        """
+        # == Decode the record markers ==========================
+        with open(partFile, 'rb') as f:
+            # First record: marker, itime, marker
+            first = np.frombuffer(f.read(12), dtype='<i4')
+            # Length of the first particle record
+            recLen = np.frombuffer(f.read(4), dtype='<i4')
+        if first[0] != 4 or recLen.size == 0:
+            raise RuntimeError(f'Unexpected partposit format: {partFile}')
+        # The record holds 12 values plus one mass per species
+        nspec = (int(recLen[0])-48)//4
+        dtype = np.dtype([('_rec0', '<i4'), ('npoint', '<i4'),
+                          ('xlon', '<f4'), ('ylat', '<f4'), ('z', '<f4'),
+                          ('itramem', '<i4'), ('topo', '<f4'),
+                          ('pv', '<f4'), ('qv', '<f4'), ('rho', '<f4'),
+                          ('hmix', '<f4'), ('tr', '<f4'), ('tt', '<f4'),
+                          ('xmass', '<f4', (nspec,)), ('_rec1', '<i4')])
+
+        # == Map the particles ==================================
+        nRecords = (os.path.getsize(partFile)-12)//dtype.itemsize
+        data = np.memmap(partFile, dtype=dtype, mode='r', offset=12,
+                         shape=(nRecords,))
+        # The last record only flags the end of the file
+        return data[:-1]
+
+    def extract_receptors(self, recFile, header):
+        """
+        Memory-map a 'receptor_conc' (or 'receptor_pptv') Fortran
+        unformatted file and return a DataArray (species, receptor,
+        time) with the 'longitude' and 'latitude' of every receptor.
+        No data is copied, values are read from disk when used, so
+        the series of a few receptors of a large network are cheap.
+
+        The file has a record with the receptor names (16
+        characters each) and one with their longitude and latitude.
+        Then, for every output time, a record with the seconds
+        since the header 'date' and one record per species with
+        the value at every receptor.
+        """
+        # == Decode the receptors ===============================
+        with open(recFile, 'rb') as f:
+            nameLen = np.frombuffer(f.read(4), dtype='<i4')[0]
+            names = np.frombuffer(f.read(nameLen), dtype='S16')
+            f.read(4)
+            posLen = np.frombuffer(f.read(4), dtype='<i4')[0]
+            positions = np.frombuffer(f.read(posLen), dtype='<f4')
+        nrec = len(names)
+        if nameLen % 16 or posLen != 8*nrec:
+            raise RuntimeError(f'Unexpected receptor format: {recFile}')
+        positions = positions.reshape(nrec, 2)
+        offset = int(nameLen+posLen+16)
+
+        # == Map the time steps =================================
+        nspec = len(header['species'])
+        specDtype = np.dtype([('_rec0', '<i4'), ('values', '<f4', (nrec,)),
+                              ('_rec1', '<i4')])
+        dtype = np.dtype([('_rec0', '<i4'), ('itime', '<i4'),
+                          ('_rec1', '<i4'), ('spec', specDtype, (nspec,))])
+        nbytes = os.path.getsize(recFile)-offset
+        if nbytes % dtype.itemsize:
+            raise RuntimeError(f'Unexpected receptor format: {recFile}')
+        data = np.memmap(recFile, dtype=dtype, mode='r', offset=offset,
+                         shape=(nbytes//dtype.itemsize,))
+        dates = header['date']+pd.to_timedelta(data['itime'], unit='s')
+        # (time, species, receptor) view on the file
+        values = data['spec']['values'].transpose(1, 2, 0)
+        coords = {'species': header['species'],
+                  'receptor': [n.decode().strip() for n in names],
+                  'time': dates,
+                  'longitude': ('receptor', positions[:, 0]),
+                  'latitude': ('receptor', positions[:, 1])}
+        return xr.DataArray(values, coords=coords,
+                            dims=('species', 'receptor', 'time'),
+                            name=os.path.basename(recFile))
+
+    def read_records(self, filePath):
+        """
+        Read a Fortran unformatted (sequential) file in one go and
+        split it into its records, each one framed by its length
+        in bytes. Return a list of memoryviews on the file buffer,
+        so no record is copied.
+        """
+        with open(filePath, 'rb') as f:
+            buffer = memoryview(f.read())
+        records = []
+        offset = 0
+        while offset < len(buffer):
+            recLen = int.from_bytes(buffer[offset:offset+4], 'little')
+            records.append(buffer[offset+4:offset+4+recLen])
+            offset += recLen+8
+        return records
+
+    def extract_header(self, headerFile):
+        """
+        Read the binary 'header' file written by FLEXPART.
+
+        Return a dict with the simulation reference 'date', the
+        output steps, the grid ('outlon0', 'outlat0', 'numxgrid',
+        'numygrid', 'dxout', 'dyout', 'outheights' and the cell
+        centres 'longitude' and 'latitude'), the 'species', a
+        DataFrame with the 'releases' boxes and times, the model
+        'switches', the age classes and the 'orography'
+        (latitude, longitude).
+
+        The file is read in one go (see 'read_records').
+        """
+        records = iter(self.read_records(headerFile))
+
+        def ints(rec):
+            return np.frombuffer(rec, '<i4').tolist()
+
+        def floats(rec):
+            return np.frombuffer(rec, '<f4').tolist()
+
+        # == Simulation and grid ================================
+        rec = next(records)
+        ibdate, ibtime = ints(rec[:8])
+        header = {'date': pd.to_datetime(f'{ibdate:08d}{ibtime:06d}'),
+                  'version': bytes(rec[8:]).decode().strip()}
+        loutstep, loutaver, loutsample = ints(next(records))
+        header.update({'ldirect': int(np.sign(loutstep)),
+                       'loutstep': loutstep, 'loutaver': loutaver,
+                       'loutsample': loutsample})
+        rec = next(records)
+        outlon0, outlat0 = floats(rec[:8])
+        numxgrid, numygrid = ints(rec[8:16])
+        dxout, dyout = floats(rec[16:24])
+        header.update({'outlon0': outlon0, 'outlat0': outlat0,
+                       'numxgrid': numxgrid, 'numygrid': numygrid,
+                       'dxout': dxout, 'dyout': dyout})
+        # Output heights are the top of every level
+        rec = next(records)
+        header['outheights'] = np.frombuffer(rec[4:], '<f4').copy()
+        # Cell centres, as in the netCDF output
+        header['longitude'] = outlon0+(np.arange(numxgrid)+0.5)*dxout
+        header['latitude'] = outlat0+(np.arange(numygrid)+0.5)*dyout
+        # Same date as the first record
+        next(records)
+
+        # == Species ============================================
+        nspec3, maxpointspec = ints(next(records))
+        species = []
+        for i in range(nspec3//3):
+            # Wet and dry deposition, then the species itself
+            next(records)
+            next(records)
+            species.append(bytes(next(records)[4:]).decode().strip())
+        header.update({'species': species, 'maxpointspec': maxpointspec})
+
+        # == Releases ===========================================
+        numpoint = ints(next(records))[0]
+        rows = []
+        for i in range(numpoint):
+            rec = next(records)
+            start, end = ints(rec[:8])
+            kindz = int(np.frombuffer(rec[8:10], '<i2')[0])
+            lon1, lat1, lon2, lat2, z1, z2 = floats(next(records))
+            npart = ints(next(records))[0]
+            comment = bytes(next(records)).decode().strip()
+            row = [start, end, lon1, lat1, lon2, lat2, z1, z2, kindz,
+                   npart, comment]
+            # Mass of each species is written three times
+            for name in species:
+                row.append(floats(next(records))[0])
+                next(records)
+                next(records)
+            rows.append(row)
+        columns = ['start', 'end', 'lon1', 'lat1', 'lon2', 'lat2', 'z1',
+                   'z2', 'kindz', 'npart', 'comment']
+        columns += [f'xmass_{name}' for name in species]
+        releases = pd.DataFrame(rows, columns=columns)
+        # Release times are seconds from the reference date
+        for col in ['start', 'end']:
+            releases[col] = header['date'] + \
+                pd.to_timedelta(releases[col], 's')
+        releases.index = pd.RangeIndex(1, numpoint+1, name='pointspec')
+        header['releases'] = releases
+
+        # == Switches, age classes and orography ================
+        names = ['method', 'lsubgrid', 'lconvection', 'ind_source',
+                 'ind_receptor']
+        header['switches'] = dict(zip(names, ints(next(records))))
+        rec = ints(next(records))
+        header.update({'nageclass': rec[0], 'lage': rec[1:]})
+        # One record per longitude
+        oro = [np.frombuffer(next(records), '<f4') for i in range(numxgrid)]
+        header['orography'] = np.array(oro).T
+        return header
+
+    def extract_namelist(self, namelistFile):
+        """
+        Read a Fortran namelist file written by FLEXPART (such as
+        'COMMAND.namelist' or 'OUTGRID.namelist').
+
+        Return a dict with one entry per group ('&COMMAND', ...)
+        holding a dict of its values. Groups appearing several
+        times (as '&RELEASE') hold a list of dicts instead.
+        """
+        groups = {}
+        with open(namelistFile, 'r') as f:
+            for line in f:
+                line = line.strip()
+                # Start of a group
+                if line.startswith('&'):
+                    name = line[1:].upper()
+                    values = {}
+                    if name not in groups:
+                        groups[name] = values
+                    elif isinstance(groups[name], list):
+                        groups[name].append(values)
+                    else:
+                        groups[name] = [groups[name], values]
+                elif '=' in line:
+                    key, value = line.split('=', 1)
+                    values[key.strip().upper()] = \
+                        self.parse_namelist_value(value)
+        return groups
+
+    def parse_namelist_value(self, value):
+        """
+        Convert the text of a namelist value into a string, a
+        number, a bool (Fortran logicals as 'T' or '.TRUE.') or a
+        list of them ('n*x' is repeated n times). Numbers may use
+        the Fortran 'D' exponent.
+
+        Values that can not be parsed are returned as the raw text.
+        """
+        value = value.strip().rstrip(',').strip()
+        # Quoted strings, or any run of characters up to a separator
+        tokens = re.findall(r"""(?:\d+\*)?(?:'[^']*'|"[^"]*"|[^,\s]+)""",
+                            value)
+        items = []
+        for token in tokens:
+            count = 1
+            repeat = re.match(r'(\d+)\*(.+)', token)
+            if repeat:
+                count, token = int(repeat.group(1)), repeat.group(2)
+            item = self.parse_namelist_item(token)
+            if item is None:
+                return value
+            items += [item]*count
+        if len(items) == 1:
+            return items[0]
+        return items
+
+    def parse_namelist_item(self, item):
+        """
+        Convert a single namelist item (see 'parse_namelist_value'),
+        returning None if it is not valid.
+        """
+        # Strings are quoted
+        if item[:1] in ('"', "'"):
+            return item[1:-1].strip()
+        logical = item.upper().strip('.')
+        if logical in ('T', 'TRUE'):
+            return True
+        if logical in ('F', 'FALSE'):
+            return False
+        try:
+            return int(item)
+        except ValueError:
+            pass
+        try:
+            return float(item.upper().replace('D', 'E'))
+        except ValueError:
+            return None
+
+    def extract_grid(self, gridFiles, header):
+        """
+        Decode the binary grid files of a run (one file per output
+        time and species, named 'grid_conc_<date>_<species>') into
+        a Dataset with the variables of the netCDF output:
+        'specNNN_mr' (nageclass, pointspec, time, height,
+        latitude, longitude) and the 'WD_specNNN'/'DD_specNNN'
+        depositions (nageclass, pointspec, time, latitude,
+        longitude).
+
+        The arrays are allocated at once from the sizes in
+        'header' (see 'extract_header') and every field is
+        scattered into them in one step (see 'decode_sparse').
+        """
+        # == Prepare the arrays =================================
+        names = [os.path.basename(f).split('_') for f in gridFiles]
+        # Backward runs are stored from the latest date, as netCDF
+        dates = sorted({n[2] for n in names}, reverse=header['ldirect'] < 0)
+        species = sorted({n[3] if len(n) > 3 else '001' for n in names})
+        nx, ny = header['numxgrid'], header['numygrid']
+        nz = len(header['outheights'])
+        shape = (header['nageclass'], header['maxpointspec'], len(dates))
+        data = {}
+        for spec in species:
+            data[f'spec{spec}_mr'] = np.zeros(shape+(nz, ny, nx), 'f4')
+            data[f'WD_spec{spec}'] = np.zeros(shape+(ny, nx), 'f4')
+            data[f'DD_spec{spec}'] = np.zeros(shape+(ny, nx), 'f4')
+
+        # == Decode the files ===================================
+        for f, n in zip(gridFiles, names):
+            t = dates.index(n[2])
+            spec = n[3] if len(n) > 3 else '001'
+            # The first record is the time, then four records per
+            # field: starts count, starts, values count, values
+            records = self.read_records(f)[1:]
+            fields = iter(zip(records[1::4], records[3::4]))
+            for kp in range(shape[1]):
+                for age in range(shape[0]):
+                    for name in ['WD_spec', 'DD_spec', 'spec']:
+                        starts, values = next(fields)
+                        idx, values = self.decode_sparse(starts, values)
+                        if name == 'spec':
+                            # Concentration levels start at 1
+                            idx -= nx*ny
+                            out = data[f'spec{spec}_mr'][age, kp, t]
+                        else:
+                            out = data[f'{name}{spec}'][age, kp, t]
+                        np.put(out, idx, values)
+
+        # == Build the dataset ==================================
+        coords = {'time': pd.to_datetime(dates, format='%Y%m%d%H%M%S'),
+                  'height': header['outheights'],
+                  'latitude': header['latitude'],
+                  'longitude': header['longitude']}
+        dims = ('nageclass', 'pointspec', 'time')
+        variables = {}
+        for name, values in data.items():
+            if name.endswith('_mr'):
+                variables[name] = (dims+('height', 'latitude', 'longitude'),
+                                   values)
+            else:
+                variables[name] = (dims+('latitude', 'longitude'), values)
+        attrs = {key: header[key] for key in
+                 ['outlon0', 'outlat0', 'dxout', 'dyout', 'ldirect',
+                  'loutstep', 'loutaver', 'loutsample']}
+        return xr.Dataset(variables, coords=coords, attrs=attrs)
+
+    def decode_sparse(self, starts, values):
+        """
+        Expand a field in FLEXPART sparse format into flat indexes
+        and values.
+
+        Only non-zero cells are stored, in runs of consecutive
+        cells: 'starts' holds the flat index of the first cell of
+        every run and 'values' the values of all runs, with the
+        sign flipped from one run to the next to mark where each
+        one ends.
+        """
+        starts = np.frombuffer(starts, '<i4').astype(np.int64)
+        values = np.frombuffer(values, '<f4')
+        # A run begins at every change of sign
+        sign = np.signbit(values)
+        newRun = np.empty(len(values), dtype=bool)
+        newRun[:1] = True
+        newRun[1:] = sign[1:] != sign[:-1]
+        run = np.cumsum(newRun)-1
+        # Position of every value within its run
+        pos = np.arange(len(values))-np.flatnonzero(newRun)[run]
+        return starts[run]+pos, np.abs(values)
+
+    def combine_trajectories(self, runDirs, saveDir, fmt=None,
+                             update=True):
         """
         Combines all trajectories data and saves in two new
         dataframes, one for trajectories and one for metadata.
         Saves the files in a directory 'output_processed/' in
         the 'saveDir' directory. Return the new location.
 
+        The files are saved as 'parquet', 'feather', 'csv' or
+        'zarr'. By default parquet is used, or csv if pyarrow is
+        not available (see 'table_format'). The rows are sorted by
+        release 'j', so parquet files can be read for a few
+        releases only (see 'load_trajectories').
+
         This function will replace the 'j' release index with a 
         new one based on the number of total trajectories
         combined.
+
+        The processed runs are noted down in 'manifest_trajectories.csv'
+        (file, size, mtime, 'j' offset and number of releases). If
+        'update' is True, calling it again only parses the runs
+        that are new or changed and adds them to the saved files,
+        renumbering the others where needed. The files always
+        hold exactly the runs given, numbered in the order of
+        'runDirs' as a full combine would.
         """
+        fmt = self.table_format(fmt)
         # == Find the netrajectories tCDF files =================
         # Iterate over them finding the nc files
         filesPaths = []
@@ -285,7 +986,7 @@ class FLEXPARTOutput():
             # Take only files starting with 'traj'
             files = [file for file in files if file.startswith('traj')]
             # Add the path
-            filesPaths.append(f'{folder}/{files[0]}')
+            filesPaths.append(os.path.abspath(f'{folder}/{files[0]}'))
 
         # == Prepare the output dir =============================
         # Create the output directory
@@ -293,13 +994,121 @@ class FLEXPARTOutput():
         if not os.path.exists(outputDir):
             os.makedirs(outputDir)
 
-        # == Iterate over the trajectory files ==================
+        # == Compare with the last combine ======================
+        dataFile = f'{outputDir}/trajectories_data.{fmt}'
+        metaFile = f'{outputDir}/trajectories_metaData.{fmt}'
+        manifestFile = f'{outputDir}/manifest_trajectories.csv'
+        # Without the former files everything is processed again
+        if not (update and os.path.exists(dataFile)
+                and os.path.exists(metaFile)):
+            if os.path.exists(manifestFile):
+                os.remove(manifestFile)
+        manifest, changed = self.check_manifest(
+            manifestFile, filesPaths, ['size', 'mtime', 'offset', 'releases'])
+
+        # == Iterate over the new trajectory files ==============
+        frames = dict(zip(changed, [self.extract_traj(f) for f in changed]))
+        # Number the runs consecutively in the order of 'runDirs', as
+        # a full combine does
+        counts = [frames[f][0]['j'].nunique() if f in frames
+                  else int(manifest.loc[f, 'releases']) for f in filesPaths]
+        offsets = np.cumsum([0]+counts[:-1])
+        newManifest = pd.DataFrame(
+            [self.file_state(f) if f in frames
+             else list(manifest.loc[f, ['size', 'mtime']])
+             for f in filesPaths], columns=['size', 'mtime'],
+            index=pd.Index(filesPaths, name='file'))
+        newManifest['offset'] = offsets
+        newManifest['releases'] = counts
+        if not changed and manifest.astype('int64').equals(newManifest):
+            logger.info('Trajectories files already processed.')
+            return outputDir
+        logger.info(f'{len(changed)} of {len(filesPaths)} trajectories '
+                    + 'files to be processed.')
+        df = df_meta = None
+        if frames:
+            df, df_meta = self.concat_trajectories(
+                list(frames.values()),
+                offsets=[offsets[filesPaths.index(f)] for f in frames])
+
+        # == Add the runs already processed =====================
+        kept = [f for f in filesPaths if f not in frames]
+        if kept:
+            # New 'j' of the former rows, 0 for the runs that changed
+            # or are not given anymore
+            last = int((manifest['offset']+manifest['releases']).max())
+            newJ = np.zeros(last+1, dtype='int64')
+            for f in kept:
+                oldOffset, releases = manifest.loc[f, ['offset',
+                                                       'releases']]
+                newOffset = newManifest.loc[f, 'offset']
+                newJ[oldOffset+1:oldOffset+releases+1] = \
+                    np.arange(1, releases+1)+newOffset
+            old = []
+            for table in [self.read_table(dataFile),
+                          self.read_table(metaFile)]:
+                j = newJ[table['j'].values]
+                table = table[j > 0].copy()
+                table['j'] = j[j > 0]
+                old.append(table)
+            df = pd.concat([old[0], df], ignore_index=True)
+            df_meta = pd.concat([old[1], df_meta], ignore_index=True)
+            df = df.sort_values('j', kind='stable', ignore_index=True)
+            df_meta = df_meta.sort_values('j', kind='stable',
+                                          ignore_index=True)
+        manifest = newManifest
+        # Save the files
+        with self.stage('save', method='combine_trajectories',
+                        rows=len(df)):
+            self.write_table(df, dataFile)
+            self.write_table(df_meta, metaFile)
+            manifest.to_csv(manifestFile)
+        # Returns the new output directory
+        return outputDir
+
+    def check_manifest(self, manifestFile, filesPaths, columns):
+        """
+        Read the manifest of a former processing ('columns' with
+        one row per file, empty if there is none) and find which
+        of 'filesPaths' are new or changed since then, by size
+        and modification time.
+
+        Return the manifest and the list of files to process.
+        """
+        if os.path.exists(manifestFile):
+            manifest = pd.read_csv(manifestFile, index_col='file')
+        else:
+            manifest = pd.DataFrame(columns=columns,
+                                    index=pd.Index([], name='file'))
+        changed = [f for f in filesPaths if f not in manifest.index
+                   or list(manifest.loc[f, ['size', 'mtime']])
+                   != self.file_state(f)]
+        return manifest, changed
+
+    def file_state(self, filePath):
+        """
+        Return the size and the modification time (ns) of a file.
+        """
+        stat = os.stat(filePath)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def concat_trajectories(self, frames, offsets=None):
+        """
+        Concatenate the trajectories of several runs, given as a
+        list of (data, metadata) tuples as returned by
+        'extract_traj'. The release index 'j' is renumbered
+        consecutively across runs and the rows are sorted by it.
+        The numbering of each run can start after the given
+        'offsets' instead.
+
+        Return the combined data and metadata.
+        """
         df_list = []
         dfMeta_list = []
         accumReleases = 0
-        for f in filesPaths:
-            # Call extract_trajectories
-            df, df_meta = self.extract_traj(f)
+        for i, (df, df_meta) in enumerate(frames):
+            if offsets is not None:
+                accumReleases = offsets[i]
             # Extract the number of current releases
             currentReleases = len(df['j'].unique())
             # Create a mapping dict to rename the 'j' index
@@ -309,34 +1118,52 @@ class FLEXPARTOutput():
             # Note down the number of releases so far
             accumReleases += currentReleases
             # Remap the 'j' index
-            df['j'].replace(mapDict, inplace=True)
+            df['j'] = df['j'].replace(mapDict)
+            df_meta['j'] = df_meta['j'].replace(mapDict)
             # Append them
             df_list.append(df)
             dfMeta_list.append(df_meta)
         # Concatenate the dataframes
         df = pd.concat(df_list, ignore_index=True)
         df_meta = pd.concat(dfMeta_list, ignore_index=True)
-        # Save the files
-        df.to_csv(f'{outputDir}/trajectories_data.csv')
-        df_meta.to_csv(f'{outputDir}/trajectories_metaData.csv')
-        # Returns the new output directory
-        return outputDir
+        # Sort them by release to read them by release later
+        df = df.sort_values('j', kind='stable', ignore_index=True)
+        df_meta = df_meta.sort_values('j', kind='stable', ignore_index=True)
+        return df, df_meta
 
-    def extract_nc(self, ncFiles):
+    def extract_nc(self, ncFiles, chunks=None):
         """
         Open the netcdf file and uploads them. If there is more
         than one it will try to open them at once
+
+        The data is backed by dask and read from disk only when
+        needed. By default the chunks follow the ones stored in the
+        file (see 'file_chunks'), so no stored chunk is read and
+        decompressed more than once. Pass a dict in 'chunks' to use
+        another policy ({} keeps the chunks of the file).
+
+        Paths ending in '.zarr' are opened as Zarr stores.
         """
+        if chunks is None:
+            chunks = self.file_chunks(ncFiles if type(ncFiles) != list
+                                      else ncFiles[0])
         if type(ncFiles) != list:
             # Open the dataset
-            dataset = xr.open_dataset(ncFiles)
+            if ncFiles.endswith('.zarr'):
+                dataset = xr.open_zarr(ncFiles, chunks=chunks)
+            else:
+                dataset = xr.open_dataset(ncFiles, chunks=chunks)
             # Take only the airtracer data and return it
             return dataset['spec001_mr']
         else:
             # Try to use open_mfdataset
             try:
+                engine = 'zarr' if all(f.endswith('.zarr')
+                                       for f in ncFiles) else None
                 dataset = xr.open_mfdataset(ncFiles, parallel=True,
-                                            concat_dim='pointspec',)
+                                            combine='nested',
+                                            concat_dim='pointspec',
+                                            chunks=chunks, engine=engine)
             except:
                 msg = ("Could not open the files. Try using "
                        + "the method 'reduce_netcdf()' to prepare "
@@ -345,7 +1172,221 @@ class FLEXPARTOutput():
             # Return it
             return dataset['spec001_mr']
 
-    def reduce_netcdf(self, runDirs, saveDir):
+    def file_chunks(self, filePath):
+        """
+        Return the dask chunks matching the storage of 'spec001_mr'
+        in 'filePath': the stored chunks along every dimension
+        (FLEXPART writes one lat/lon/height block per release and
+        time step), grouping as many releases per chunk as dask
+        finds convenient. Data stored without chunks uses
+        'ncChunks'.
+        """
+        engine = 'zarr' if filePath.endswith('.zarr') else None
+        with xr.open_dataset(filePath, engine=engine) as ds:
+            stored = ds['spec001_mr'].encoding.get('preferred_chunks')
+        if not stored:
+            return dict(self.ncChunks)
+        return {**stored, 'pointspec': 'auto'}
+
+    def index_coords(self, ds):
+        """
+        Read the coordinates of 'ds' into pandas indexes, so they
+        are not rebuilt for every frame. Return a dict with the
+        keys 'time', 'height', 'latitude' and 'longitude'.
+        """
+        return {'time': pd.DatetimeIndex(ds.time.values),
+                'height': pd.Index(ds.height.values),
+                'latitude': pd.Index(ds.latitude.values),
+                'longitude': pd.Index(ds.longitude.values)}
+
+    def frames_for(self, dates):
+        """
+        Return the time indexes of the netCDF data nearest to each
+        of 'dates' (a date or a list of them), found in a single
+        lookup over the cached time index.
+        """
+        dates = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(dates)))
+        return self.ncCoords['time'].get_indexer(dates, method='nearest')
+
+    def get_pointspec(self, releases):
+        """
+        Return the 'pointspec' indexes of the netCDF data for a
+        list of releases numbers (starting at 1, as 'j' in the
+        trajectories). Consecutive releases give a slice, which is
+        read from disk in a single block.
+
+        An empty selection, or releases not in the data, raise a
+        ValueError.
+        """
+        idx = np.asarray(releases, dtype=int).ravel()-1
+        nReleases = self.ncData.sizes['pointspec']
+        if len(idx) == 0:
+            raise ValueError('No releases selected.')
+        outside = idx[(idx < 0) | (idx >= nReleases)]
+        if len(outside) > 0:
+            raise ValueError(f'Releases {(outside+1).tolist()} not in the '
+                             + f'data (releases 1 to {nReleases}).')
+        if np.all(np.diff(idx) == 1):
+            return slice(idx[0], idx[-1]+1)
+        return idx
+
+    def get_releases_dateRange(self, dateLims):
+        """
+        Return the numbers of the releases chosen by
+        'get_traj_dateRange' for the date limits 'dateLims'
+        (those starting within them). The trajectories are
+        loaded if needed.
+        """
+        if self.trajData is None:
+            self.load_trajectories()
+        return self.get_traj_dateRange(dateLims=dateLims).index.tolist()
+
+    def get_receptor_series(self, receptors=None, species=0,
+                            dateLims=[None, None]):
+        """
+        Return the time series at the receptors as a DataFrame
+        indexed by time with one column per receptor. Only the
+        values selected are read from the file.
+
+        Input:
+        - receptors     List of receptors names. By default all of
+                        them.
+        - species       Name or position of the species.
+        - dateLims      Dates [start, end] to restrict the series.
+        """
+        if self.recData is None:
+            self.load_receptors()
+        data = self.recData
+        # Select with positions, several receptors may share a name
+        if isinstance(species, str):
+            species = data.indexes['species'].get_loc(species)
+        data = data.isel(species=species)
+        if receptors is not None:
+            names = data['receptor'].values
+            data = data.isel(receptor=np.flatnonzero(np.isin(names,
+                                                             receptors)))
+        keep = self.date_mask(data.indexes['time'], dateLims)
+        data = data.isel(time=np.flatnonzero(keep))
+        return pd.DataFrame(data.values.T, index=data.indexes['time'],
+                            columns=data['receptor'].values)
+
+    def load_plume_total(self, saveCache=True):
+        """
+        Computes the plume summed over all releases (time, height,
+        latitude, longitude) and keeps it in 'ncTotal'. Once loaded,
+        'plotMap_plume' uses it instead of reducing each frame.
+
+        The result is saved next to the netCDF output as
+        'plumeTotal_cache.nc' together with a key built from the
+        name, size and modification time of the source files. The
+        cache is reused while the key matches and rebuilt otherwise.
+        Set 'saveCache = False' to keep the result only in memory.
+        """
+        # == Check the source data ==============================
+        if self.ncData is None:
+            self.load_netcdf()
+        ncFiles = self.ncFiles
+        if type(ncFiles) != list:
+            ncFiles = [ncFiles]
+        # Build the invalidation key
+        key = ';'.join(f'{os.path.basename(f)}:{os.path.getsize(f)}:'
+                       + f'{os.path.getmtime(f)}' for f in ncFiles)
+        cacheFile = os.path.join(os.path.dirname(ncFiles[0]),
+                                 self.plumeCacheName)
+
+        # == Try to use the existing cache ======================
+        if os.path.exists(cacheFile):
+            total = xr.open_dataarray(cacheFile,
+                                      chunks={'time': 1, 'height': 1})
+            if total.attrs.get('cacheKey') == key:
+                logger.info('Using cached plume summed over releases.')
+                self.ncTotal = total
+                return self.ncTotal
+            # The source data changed, rebuild it
+            total.close()
+
+        # == Compute the total plume ============================
+        logger.info('Summing the plume over releases...')
+        total = self.ncData[0].sum(dim='pointspec')
+        total.name = 'spec001_mr_total'
+        total.attrs = {'long_name': 'spec001_mr summed over releases',
+                       'cacheKey': key}
+        with self.stage('reduce', method='load_plume_total',
+                        releases=self.ncData.sizes['pointspec']):
+            if saveCache:
+                total.to_netcdf(cacheFile, mode='w')
+                total = xr.open_dataarray(cacheFile,
+                                          chunks={'time': 1, 'height': 1})
+            else:
+                total = total.compute()
+        logger.info(' Done.')
+        self.ncTotal = total
+        return self.ncTotal
+
+    def integrate_footprint(self, time_range=None, heights=None,
+                            releases=None):
+        """
+        Integrate the source-receptor sensitivity over time, height
+        and releases, returning a (latitude, longitude) DataArray
+        (the total residence time in seconds).
+
+        The sum is done by dask chunk by chunk (as stored in the
+        file, see 'extract_nc'), so the memory used does not depend
+        on the size of the data and large merged files can be
+        integrated.
+
+        Input:
+        - time_range    Dates [start, end] to integrate, None for an
+                        open end. By default all the simulation.
+        - heights       List of height levels (indexes, as 'level'
+                        in 'plotMap_plume'). By default all of them.
+        - releases      List of releases numbers (starting at 1).
+                        By default all of them.
+        """
+        # == Select the data ====================================
+        if self.ncData is None:
+            self.load_netcdf()
+        ds = self.ncData[0]
+        if time_range is not None:
+            keep = self.date_mask(self.ncCoords['time'], time_range)
+            if not keep.any():
+                raise ValueError('No output times within time_range.')
+            ds = ds.isel(time=np.flatnonzero(keep))
+        if heights is not None:
+            ds = ds.isel(height=list(heights))
+        if releases is not None:
+            ds = ds.isel(pointspec=self.get_pointspec(releases))
+
+        # == Integrate ==========================================
+        logger.info('Integrating the footprint...')
+        footprint = ds.sum(dim=['pointspec', 'time', 'height'])
+        with self.stage('reduce', method='integrate_footprint',
+                        cells=ds.size):
+            footprint = footprint.compute()
+        footprint.name = 'footprint'
+        footprint.attrs = {'long_name': 'spec001_mr integrated over '
+                           + 'time, height and releases',
+                           'units': 's'}
+        logger.info(' Done.')
+        return footprint
+
+    def find_netcdf(self, runDir, files=None):
+        """
+        Return the path of the netCDF output of the run in 'runDir',
+        the first '.nc' file by name leaving out the plume cache.
+        'files' is the listing of the directory, if already known.
+
+        Raise FileNotFoundError if there is none.
+        """
+        if files is None:
+            files = os.listdir(runDir)
+        files = sorted(f for f in files if f.endswith('.nc')
+                       and f != self.plumeCacheName)
+        if not files:
+            raise FileNotFoundError(f'No netCDF file in {runDir}.')
+        return f'{runDir}/{files[0]}'
+
+    def reduce_netcdf(self, runDirs, saveDir, fmt='nc', update=True):
         """
         Iterates over a list of FLEXPART simulations directories,
         looks for the output directory and the netCDF output file.
@@ -356,16 +1397,31 @@ class FLEXPARTOutput():
         absolute paths to the FLEXPART output directories. 
         The new output directory, 'output_processed' will be 
         created in the 'saveDir' directory.
+
+        The files are saved as netCDF ('nc') or as Zarr stores
+        ('zarr') depending on 'fmt'.
+
+        To reduce and combine the runs in one step, without the
+        intermediate files, see 'merge_runs'.
+
+        The processed files are noted down in 'manifest_netcdf.csv'.
+        If 'update' is True, calling it again only processes the
+        files that are new or changed, or whose reduced file is
+        missing. The files of all the runs are returned.
+
+        Note that 'combine_netcdf' removes the reduced files by
+        default ('clean=True'), so the next call reduces every run
+        again. Keep them ('clean=False') to profit from 'update'.
+        Combining is not incremental: the merged file is always
+        written again from all the reduced files.
         """
         # == Find the netCDF files ==================================
         # Iterate over them finding the nc files
         filesPaths = []
-        for folder in runDirs:
-            files = os.listdir(f'{folder}/')
-            # Take only files ending in .nc
-            files = [file for file in files if file.endswith('.nc')]
-            # Add the path
-            filesPaths.append(f'{folder}/{files[0]}')
+        with self.stage('discovery', method='reduce_netcdf') as info:
+            for folder in runDirs:
+                filesPaths.append(os.path.abspath(self.find_netcdf(folder)))
+            info['files'] = len(filesPaths)
 
         # == Prepare the output dir =================================
         # Create the output directory
@@ -373,105 +1429,390 @@ class FLEXPARTOutput():
         if not os.path.exists(outputDir):
             os.makedirs(outputDir)
 
+        # == Compare with the last reduction ========================
+        manifestFile = f'{outputDir}/manifest_netcdf.csv'
+        if not update and os.path.exists(manifestFile):
+            os.remove(manifestFile)
+        manifest, changed = self.check_manifest(
+            manifestFile, filesPaths, ['size', 'mtime', 'output'])
+        # Reduced files removed or saved in another format
+        changed += [f for f in filesPaths if f not in changed
+                    and (not manifest.loc[f, 'output'].endswith(f'.{fmt}')
+                         or not os.path.exists(manifest.loc[f, 'output']))]
+
         # == Clean the files ========================================
         # Iterate over files
-        print(f'\n{len(filesPaths)} netCDF files to be processed:')
-        newFiles = []
-        for i, f in enumerate(filesPaths):
-            print(f' Processing file {i+1}...')
-            data = xr.open_dataset(f)
-            data = data['spec001_mr']
-            print(f'  Saving file {i+1}...')
-            newFile = f'{outputDir}/FPOutput_{str(i).zfill(3)}.nc'
-            data.to_netcdf(newFile, mode='w')
-            newFiles.append(newFile)
-            print(f'  Closing the file.')
-            data.close()
+        logger.info(f'{len(changed)} of {len(filesPaths)} netCDF files '
+                    + 'to be processed:')
+        for i, f in enumerate(changed):
+            logger.info(f' Processing file {i+1}...')
+            with self.stage('reduce', method='reduce_netcdf', file=f,
+                            sizeOnDisk=lambda: os.path.getsize(f)):
+                data = xr.open_dataset(f)
+                data = data['spec001_mr']
+                # Keep the number of the file if it was processed before
+                if f in manifest.index:
+                    number = manifest.loc[f, 'output'].split('_')[-1]
+                    number = number.split('.')[0]
+                else:
+                    number = str(len(manifest)).zfill(3)
+                newFile = f'{outputDir}/FPOutput_{number}.{fmt}'
+                self.write_data(data, newFile)
+                manifest.loc[f] = self.file_state(f)+[newFile]
+                data.close()
+        manifest.to_csv(manifestFile)
         # Return the files
-        return newFiles
+        return [manifest.loc[f, 'output'] for f in filesPaths]
 
-    def combine_netcdf(self, filesList, saveDir, clean=True):
+    def combine_netcdf(self, filesList, saveDir, clean=True, fmt='nc'):
         """
         Combine the netCDF in 'filesList' into a single netCDF file.
         This function should be used with the list of files returned
         by 'reduce_netcdf'.
 
+        The result is saved as netCDF ('nc') or as a Zarr store
+        chunked by time and height ('zarr') depending on 'fmt'.
+
         It will remove the individual files after combining them. To
-        avoid this behavior set 'clean = False'.
+        avoid this behavior set 'clean = False' (needed for later
+        calls of 'reduce_netcdf' to only process new runs). The
+        merged file is always written again from all the files.
         """
         # == Combine the data files =================================
         # Load with open_mfdataset
-        data = xr.open_mfdataset(filesList, concat_dim='pointspec',
-                                 parallel=True)
+        with self.stage('open', method='combine_netcdf') as info:
+            engine = 'zarr' if all(f.endswith('.zarr')
+                                   for f in filesList) else None
+            data = xr.open_mfdataset(filesList, concat_dim='pointspec',
+                                     combine='nested', parallel=True,
+                                     engine=engine)
+            info['files'] = len(filesList)
         # Save the new data and close the file
-        print('\nCombining the files. \nPlease wait, this may take some time...')
-        nc = data.to_netcdf(f'{saveDir}/FPOutput_merged.nc',
-                            mode='w', compute=False)
-        with ProgressBar():
+        logger.info('Combining the files. Please wait, this may take '
+                    + 'some time...')
+        with self.stage('save', method='combine_netcdf',
+                        sizeOnDisk=lambda: sum(disk_size(f)
+                                               for f in filesList)):
+            nc = self.write_data(data, f'{saveDir}/FPOutput_merged.{fmt}',
+                                 compute=False)
             results = nc.compute()
         # Close the file
         data.close()
-        print(' Done.')
+        logger.info(' Done.')
         # Clean the directory
         if clean:
             for f in filesList:
-                os.remove(f)
+                if os.path.isdir(f):
+                    shutil.rmtree(f)
+                else:
+                    os.remove(f)
+
+    def merge_runs(self, runDirs, saveDir, fmt='nc'):
+        """
+        Merge the airtracer data of several FLEXPART simulations
+        into a single netCDF file, appending the releases of each
+        run along 'pointspec'. Does the same as 'reduce_netcdf'
+        followed by 'combine_netcdf' but streaming the data: it is
+        copied one time step of one run at a time, so memory is
+        bounded and no intermediate files are written.
+
+        Runs with different time steps are placed on the union of
+        all times, missing values are filled with NaN.
+
+        With fmt='zarr' the runs are appended to a Zarr store
+        'FPOutput_merged.zarr' chunk by chunk instead.
+
+        Assumes that the directories listed in 'runDirs' are 
+        absolute paths to the FLEXPART output directories. The file
+        'FPOutput_merged.nc' is created in 'output_processed' in
+        the 'saveDir' directory. Return its path.
+        """
+        # == Find the netCDF files ==================================
+        # Iterate over them finding the nc files
+        filesPaths = [self.find_netcdf(folder) for folder in runDirs]
+
+        # == Prepare the output dir =================================
+        # Create the output directory
+        outputDir = os.path.abspath(saveDir+'/output_processed/')
+        if not os.path.exists(outputDir):
+            os.makedirs(outputDir)
+        mergedFile = f'{outputDir}/FPOutput_merged.{fmt}'
+
+        # == Build the common axes ==================================
+        # Only the coordinates are read here
+        logger.info(f'{len(filesPaths)} netCDF files to be merged:')
+        runTimes = []
+        for f in filesPaths:
+            with Dataset(f) as src:
+                time = src['time']
+                dates = num2date(time[:], time.units, time.calendar,
+                                 only_use_cftime_datetimes=False)
+                runTimes.append(pd.to_datetime(dates))
+        # Keep the time order of the first run
+        times = np.unique(np.concatenate([t.values for t in runTimes]))
+        times = pd.DatetimeIndex(times)
+        if runTimes[0].is_monotonic_decreasing:
+            times = times[::-1]
+
+        # == Append the runs to a Zarr store ========================
+        if fmt == 'zarr':
+            for i, f in enumerate(filesPaths):
+                logger.info(f' Merging file {i+1}...')
+                chunks = self.file_chunks(f)
+                with self.stage('merge', method='merge_runs', file=f,
+                                sizeOnDisk=lambda: os.path.getsize(f)), \
+                        xr.open_dataset(f, chunks=chunks) as src:
+                    data = src[['spec001_mr']].reindex(time=times)
+                    self.write_data(data, mergedFile,
+                                    appendDim='pointspec' if i else None)
+            logger.info(f' Done.')
+            return mergedFile
+
+        # == Create the merged file =================================
+        out = Dataset(mergedFile, 'w', format='NETCDF4')
+        with Dataset(filesPaths[0]) as src:
+            spec = src['spec001_mr']
+            # Releases are appended, all other dimensions are fixed
+            for dim in spec.dimensions:
+                size = len(times) if dim == 'time' else \
+                    src.dimensions[dim].size
+                out.createDimension(dim, None if dim == 'pointspec'
+                                    else size)
+            # Copy the coordinates
+            for name in ['height', 'latitude', 'longitude']:
+                var = out.createVariable(name, src[name].dtype, (name,))
+                var.setncatts(src[name].__dict__)
+                var[:] = src[name][:]
+            var = out.createVariable('time', 'i4', ('time',))
+            var.setncatts(src['time'].__dict__)
+            var[:] = date2num(times.to_pydatetime(), var.units,
+                              var.calendar)
+            # Create the airtracer variable with the same layout
+            chunks = spec.chunking()
+            merged = out.createVariable(
+                'spec001_mr', spec.dtype, spec.dimensions,
+                fill_value=np.nan, zlib=True, complevel=4,
+                chunksizes=None if chunks == 'contiguous' else chunks)
+            merged.setncatts({k: v for k, v in spec.__dict__.items()
+                              if k != '_FillValue'})
+
+        # == Copy the data slab by slab =============================
+        offset = 0
+        for i, f in enumerate(filesPaths):
+            logger.info(f' Merging file {i+1}...')
+            with self.stage('merge', method='merge_runs', file=f,
+                            sizeOnDisk=lambda: os.path.getsize(f)), \
+                    Dataset(f) as src:
+                spec = src['spec001_mr']
+                n = spec.shape[1]
+                # Position of each time step in the merged file
+                idxTime = times.get_indexer(runTimes[i])
+                for t, tOut in enumerate(idxTime):
+                    merged[:, offset:offset+n, tOut] = spec[:, :, t]
+                offset += n
+        out.close()
+        logger.info(f' Done. {offset} releases merged.')
+        # Return the merged file
+        return mergedFile
+
+    def write_data(self, data, filePath, compute=True, appendDim=None):
+        """
+        Save gridded data to 'filePath' as netCDF or, if the path
+        ends with '.zarr', as a Zarr store chunked as 'ncChunks'.
+        With 'appendDim' the data is appended to an existing Zarr
+        store along that dimension.
+
+        With compute=False the dask delayed object is returned.
+        """
+        if not filePath.endswith('.zarr'):
+            return data.to_netcdf(filePath, mode='w', compute=compute)
+        if isinstance(data, xr.DataArray):
+            data = data.to_dataset()
+        chunks = {k: v for k, v in self.ncChunks.items() if k in data.dims}
+        data = data.chunk(chunks)
+        # The netCDF encoding does not apply to Zarr
+        for var in data.variables:
+            data[var].encoding = {}
+        if appendDim:
+            return data.to_zarr(filePath, append_dim=appendDim,
+                                compute=compute)
+        return data.to_zarr(filePath, mode='w', compute=compute)
+
+    def table_format(self, fmt=None):
+        """
+        Check that trajectories can be saved as 'fmt' before any
+        work is done. Parquet and feather need pyarrow, ImportError
+        is raised without it. By default (None) parquet is used if
+        pyarrow works and csv otherwise.
 
-    def extract_positions(self, df):
+        Return the format to use.
+        """
+        if fmt not in (None, 'parquet', 'feather'):
+            return fmt
+        try:
+            import pyarrow
+        except ImportError as error:
+            if fmt is not None:
+                raise ImportError(f"Saving as '{fmt}' needs pyarrow: "
+                                  + f'{error}') from error
+            logger.warning(f'pyarrow is not available ({error}), the '
+                           + 'trajectories are saved as csv.')
+            return 'csv'
+        return fmt or 'parquet'
+
+    def write_table(self, df, filePath, rowGroup=100000):
+        """
+        Save a trajectories dataframe to 'filePath'. The format is
+        chosen by the extension: 'parquet', 'feather', 'csv' or
+        'zarr' (one array per column).
+
+        Parquet files are written in row groups of 'rowGroup' rows
+        with their min/max statistics, so a dataframe sorted by
+        release allows reading single releases.
+        """
+        if filePath.endswith('.parquet'):
+            df.to_parquet(filePath, index=False,
+                          row_group_size=rowGroup)
+        elif filePath.endswith('.feather'):
+            df.reset_index(drop=True).to_feather(filePath)
+        elif filePath.endswith('.zarr'):
+            df = df.reset_index(drop=True)
+            # Zarr has no python objects, save text as strings
+            for col in df.columns[df.dtypes == object]:
+                df[col] = df[col].astype(str)
+            ds = xr.Dataset.from_dataframe(df)
+            # Zarr lists the arrays by name, keep the columns order
+            ds.attrs['columns'] = list(df.columns)
+            ds.chunk({'index': 1000000}).to_zarr(filePath, mode='w')
+        else:
+            df.to_csv(filePath, index=False)
+
+    def read_table(self, filePath, releases=None, columns=None):
+        """
+        Read a trajectories dataframe saved with 'write_table'.
+
+        Only the releases listed in 'releases' and the columns in
+        'columns' are returned. Parquet files skip the rest while
+        reading, the other formats filter them afterwards. Release
+        'j' is always kept, as the trajectories are indexed by it.
+        """
+        if columns is not None:
+            columns = ['j'] + [c for c in columns if c != 'j']
+        if filePath.endswith('.parquet'):
+            filters = None
+            if releases is not None:
+                filters = [('j', 'in', list(releases))]
+            return pd.read_parquet(filePath, columns=columns,
+                                   filters=filters)
+        if filePath.endswith('.feather'):
+            df = pd.read_feather(filePath, columns=columns)
+        elif filePath.endswith('.zarr'):
+            with xr.open_zarr(filePath) as ds:
+                df = ds.to_dataframe().reset_index(drop=True)
+                df = df[ds.attrs['columns']]
+        else:
+            df = pd.read_csv(filePath, parse_dates=['Date'])
+        if releases is not None:
+            df = df[df['j'].isin(releases)].reset_index(drop=True)
+        if columns is not None:
+            df = df[columns]
+        return df
+
+    def index_releases(self, df):
+        """
+        Group the rows of a trajectories dataframe by release 'j',
+        keeping their order within each release, and build a dict
+        with the slice of rows of every release.
+
+        Return the (maybe reordered) dataframe and the dict. The
+        dataframe is returned as it is if it was already grouped,
+        which is the case for 'extract_traj' and processed data.
+        """
+        j = df['j'].values
+        # First row of every block of consecutive releases
+        starts = np.flatnonzero(np.r_[True, j[1:] != j[:-1]])
+        # Group the rows if some release is split in several blocks
+        if len(starts) != len(np.unique(j)):
+            order = np.argsort(j, kind='stable')
+            df = df.iloc[order].reset_index(drop=True)
+            j = j[order]
+            starts = np.flatnonzero(np.r_[True, j[1:] != j[:-1]])
+        stops = np.r_[starts[1:], len(j)]
+        index = {release: slice(start, stop) for release, start, stop
+                 in zip(j[starts].tolist(), starts, stops)}
+        return df, index
+
+    def select_releases(self, releases=None):
+        """
+        Return the rows of 'trajData' belonging to 'releases' using
+        the release index. If 'releases' is empty or None all the
+        data is returned, without copying it.
+        """
+        if not releases:
+            return self.trajData
+        rows = np.r_[tuple(self.trajIndex[release] for release in releases)]
+        return self.trajData.iloc[rows]
+
+    def extract_positions(self, df=None):
         """
         Converts the trajectories dataframe into a dict with 
-        one list for each release. Each list consists of three lists
-        containing date, longitude, latitude and height.
+        one list for each release. Each list consists of tuples
+        with longitude, latitude and height.
+
+        If 'df' is None it will use the data already loaded.
 
         (Not being used right now)
         """
-        # Extract info about releases
-        releases = df['j'].unique()
+        # Use the release index, building it for external data
+        if df is None:
+            df, index = self.trajData, self.trajIndex
+        else:
+            df, index = self.index_releases(df)
+        x = df['xcenter'].values
+        y = df['ycenter'].values
+        z = df['zcenter'].values
         # Iterate over each realease
         releases_pos = {}
-        for release in releases:
-            # Create a dataframe with the release info
-            df_temp = df[df['j'] == release]
+        for release, rows in index.items():
             # Create a list of tuples (longitude, latitude, height)
-            pos_temp = [(row['xcenter'], row['ycenter'], row['zcenter'])
-                        for idx, row in df_temp.iterrows()]
-            # Save the positions
-            releases_pos[release] = pos_temp
+            releases_pos[release] = list(zip(x[rows], y[rows], z[rows]))
         # Return the results
         return releases_pos
 
-    def plotMap_traj(self, releases=None, extent=None,
-                     fsize=(12, 10)):
-        '''
-        Plots a simple map to take a quick look about trajectories. 
+    def get_baseMap(self, extent, fsize=(10, 8), reuse=False):
+        """
+        Create a figure with a PlateCarree map limited to 'extent'
+        ([lon_min, lon_max, lat_min, lat_max]), with coastlines and
+        gridlines. Return the figure, the axes and a list where the
+        caller notes down the data artists drawn on it.
 
-        Input:
-        - releases  List of integers. References the releases numbers
-                    to plot
-        - extent    Limits of the map (lonMax,lonMin,latMax,latMin). If
-                    None will use the limits of the trajectories
-        - fsize     Size of the figure (height,width)
-        '''
-        # Extract inner data
-        df = self.trajData.copy()
-        # Specify the releases to plot
-        if not releases:
-            releases = df['j'].unique()
-        # Create a dataframe with only the relevant releases
-        dfTemp = df[df['j'].isin(releases)]
+        If 'reuse' is True the map is kept in 'baseMaps' and later
+        calls with the same extent and size return the same figure
+        after removing the artists in that list. This way the map
+        is only built once for multi-frame plots.
+        """
+        key = (tuple(float(e) for e in extent), tuple(fsize))
+        # == Reuse the cached map ===============================
+        if reuse and key in self.baseMaps:
+            fig, ax, artists = self.baseMaps[key]
+            # Remove the data of the previous frame, last drawn first
+            for artist in reversed(artists):
+                artist.remove()
+            artists.clear()
+            return fig, ax, artists
+
+        # == Create the map =====================================
+        import cartopy.crs as ccrs
+        import matplotlib.pyplot as plt
+        from seaborn import set_style
+        from cartopy.mpl.gridliner import (LONGITUDE_FORMATTER,
+                                           LATITUDE_FORMATTER)
         # Create figure and axes
         set_style('ticks')
         fig = plt.figure(figsize=fsize)
         ax = plt.axes(projection=ccrs.PlateCarree())
-        # Find and stablish its limits
-        if extent:
-            ax.set_extent(extent)
-        else:
-            lon_max = np.ceil(dfTemp['xcenter'].max()+0.5)
-            lon_min = np.floor(dfTemp['xcenter'].min()-0.5)
-            lat_max = np.ceil(dfTemp['ycenter'].max()+0.5)
-            lat_min = np.floor(dfTemp['ycenter'].min()-0.5)
-            ax.set_extent([lon_min, lon_max, lat_min, lat_max])
+        # Stablish its limits
+        ax.set_extent(extent, crs=ccrs.PlateCarree())
         # Draw coastlines
         ax.coastlines('50m', linewidth=1, color='black')
         # Prepare the grid
@@ -482,24 +1823,104 @@ class FLEXPARTOutput():
         gd.ylabels_right = False  # Take out right labels
         gd.xformatter = LONGITUDE_FORMATTER  # Format of lon ticks
         gd.yformatter = LATITUDE_FORMATTER  # Format of lat ticks
-        # Iterate over releases
-        for release in releases:
-            # Extract a dataframe for the current release
-            df_rls = dfTemp[dfTemp['j'] == release]
-            # Plot the first point as a dot
-            ax.plot(df_rls.iloc[0]['xcenter'], df_rls.iloc[0]['ycenter'], 'ko')
-            # Plot the trajectorys
-            ax.plot(df_rls['xcenter'], df_rls['ycenter'],
-                    color='red', linestyle='--')
+        gd.xlabel_style = {'size': 10, 'color': 'k'}
+        gd.ylabel_style = {'size': 10, 'color': 'k'}
+        artists = []
+        # Save it for later calls
+        if reuse:
+            self.baseMaps[key] = (fig, ax, artists)
+        return fig, ax, artists
+
+    def close_baseMaps(self, keys=None):
+        """
+        Close the maps kept by 'get_baseMap' (the ones in 'keys',
+        by default all of them) and forget them.
+        """
+        import matplotlib.pyplot as plt
+        if keys is None:
+            keys = list(self.baseMaps)
+        for key in keys:
+            plt.close(self.baseMaps.pop(key)[0])
+
+    def plotMap_traj(self, releases=None, extent=None,
+                     fsize=(12, 10), color=None):
+        '''
+        Plots a simple map to take a quick look about trajectories. 
+
+        All the trajectories are drawn as a single LineCollection
+        and their first points as a single scatter, so large
+        campaigns are plotted at once.
+
+        Input:
+        - releases  List of integers. References the releases numbers
+                    to plot
+        - extent    Limits of the map (lonMax,lonMin,latMax,latMin). If
+                    None will use the limits of the trajectories
+        - fsize     Size of the figure (height,width)
+        - color     None draws dashed red lines. 'date' or 'height'
+                    colours every step of the trajectories by its
+                    date or its height, with a colorbar.
+        '''
+        # Extract the relevant releases
+        dfTemp = self.select_releases(releases)
+        x = dfTemp['xcenter'].values
+        y = dfTemp['ycenter'].values
+        # Find the map limits
+        if not extent:
+            lon_max = np.ceil(x.max()+0.5)
+            lon_min = np.floor(x.min()-0.5)
+            lat_max = np.ceil(y.max()+0.5)
+            lat_min = np.floor(y.min()-0.5)
+            extent = [lon_min, lon_max, lat_min, lat_max]
+        # Create figure and axes with coastlines and grid
+        fig, ax, artists = self.get_baseMap(extent, fsize=fsize)
+        import matplotlib.dates as mdates
+        from matplotlib.collections import LineCollection
+        # First row of every release (rows are grouped by release)
+        j = dfTemp['j'].values
+        starts = np.flatnonzero(np.r_[True, j[1:] != j[:-1]])
+        points = np.column_stack([x, y])
+        # == Plot the trajectories ==============================
+        if color is None:
+            # One polyline per release
+            lines = np.split(points, starts[1:])
+            lc = LineCollection(lines, colors='red', linestyles='--')
+        else:
+            # One segment per step, skipping the jumps between releases
+            inside = j[1:] == j[:-1]
+            segments = np.stack([points[:-1], points[1:]], axis=1)[inside]
+            if color == 'date':
+                values = mdates.date2num(dfTemp['Date'].values)
+            elif color == 'height':
+                values = dfTemp['zcenter'].values
+            else:
+                raise ValueError(f"color must be None, 'date' or 'height', "
+                                 + f"not {color!r}")
+            lc = LineCollection(segments, cmap='viridis')
+            lc.set_array(values[:-1][inside])
+        ax.add_collection(lc)
+        # Plot the first points as dots
+        ax.scatter(x[starts], y[starts], c='k', s=36)
+        # == Make the colorbar ==================================
+        if color == 'date':
+            cb = fig.colorbar(lc, ax=ax, shrink=0.7)
+            cb.ax.yaxis.set_major_formatter(
+                mdates.DateFormatter('%Y/%m/%d %H:%M'))
+        elif color == 'height':
+            fig.colorbar(lc, ax=ax, shrink=0.7, label='Height (m)')
         # return the figure just in case
         return (fig, ax)
 
     def get_traj_dateRange(self, releases=None, show=False,
-                           dateLims=[None, None]):
+                           dateLims=[None, None], overlap=False):
         """
         Retrieve information about the date range of the releases. If 
         'show' is set to true it will print the information as well.
 
+        Return a DataFrame indexed by release ('j') with the
+        columns 'start' and 'end' (first and last date of every
+        trajectory).
+
         The number of the releases to be used can be defined using the
         variable 'releases'. It should be a list with the numbers 
         identifying the releases.
@@ -510,82 +1931,105 @@ class FLEXPARTOutput():
         is contained within 'dateLims'. This variable is a 2-item list
         with strings defining the start and end limits, respectively.
         Example: ['2017-08-28 12:00','2017-08-28 14:00']
+        With 'overlap' set to True it returns instead the releases
+        whose whole range overlaps 'dateLims'.
         """
-        # Extract inner data
-        df = self.trajData.copy()
-        # Specify the releases to plot
-        if not releases:
-            releases = df['j'].unique()
-        # Create a dataframe with only the relevant releases
-        dfTemp = df[df['j'].isin(releases)]
-        # Iterate over releases
-        dateRange = {}
-        for release in releases:
-            # Extract the current dateRange and save it
-            dateTemp = dfTemp[dfTemp['j'] == release]['Date']
-            dateRange[release] = (dateTemp.min(), dateTemp.max())
+        # Compute the ranges of every release once
+        if self.trajRanges is None:
+            dates = self.trajData.groupby('j', sort=False)['Date']
+            self.trajRanges = dates.agg(start='min', end='max')
+        dateRange = self.trajRanges
+        # Specify the releases to use
+        if releases:
+            dateRange = dateRange.loc[list(releases)]
         # Restrict releases
-        dateRange = self.restrict_releases_dateRange(dateRange, dateLims)
+        dateRange = self.restrict_releases_dateRange(dateRange, dateLims,
+                                                     overlap=overlap)
         # If required print a message
         if show:
             print('\nReleases range:')
-            for release in dateRange:
-                a = dateRange[release][0].strftime("%Y/%m/%d %H:%M")
-                z = dateRange[release][1].strftime("%Y/%m/%d %H:%M")
+            for release, a, z in dateRange.itertuples():
+                a = a.strftime("%Y/%m/%d %H:%M")
+                z = z.strftime("%Y/%m/%d %H:%M")
                 print(f' Release {release} time range: {a} to {z}')
         # Return results
         return dateRange
 
-    def restrict_releases_dateRange(self, dateRange, dateLims):
+    def restrict_releases_dateRange(self, dateRange, dateLims,
+                                    overlap=False):
         """
         Restrict the releases according to their starting dates
-        and provided limits.
+        and provided limits. 'dateRange' is a DataFrame as the
+        one returned by 'get_traj_dateRange'.
+
+        If 'overlap' is True, keep the releases whose range
+        [start, end] overlaps the limits instead.
         """
-        # Transform dateLims to datetime if they exist
-        if dateLims[0]:
-            dateLims[0] = pd.to_datetime(dateLims[0])
-        if dateLims[1]:
-            dateLims[1] = pd.to_datetime(dateLims[1])
-        # Iterate over dateRange but modifying a copy
-        dateRangeCopy = dateRange.copy()
-        for release in dateRange:
-            if dateLims[0]:
-                # Pop out if release beginning <= startLimit
-                if dateRange[release][0] <= dateLims[0]:
-                    dateRangeCopy.pop(release, None)
-            if dateLims[1]:
-                # Pop out if release beginning <= endLimit
-                if dateRange[release][0] >= dateLims[1]:
-                    dateRangeCopy.pop(release, None)
+        startLim, endLim = dateLims
+        # Compare all the releases at once
+        if overlap:
+            keep = (self.date_mask(dateRange['end'], [startLim, None])
+                    & self.date_mask(dateRange['start'], [None, endLim]))
+        else:
+            # Release beginning must be within the limits
+            keep = self.date_mask(dateRange['start'], dateLims,
+                                  inclusive=False)
         # Return the result
-        return dateRangeCopy
+        return dateRange[keep]
 
-    def plotFoliumMap_traj(self, releases=None):
+    def date_mask(self, dates, dateLims, inclusive=True):
+        """
+        Return a boolean array telling which of 'dates' are within
+        'dateLims' ([start, end], None for an open end). The limits
+        themselves are within unless 'inclusive' is False.
+        """
+        # Transform dateLims to datetime if they exist
+        startLim, endLim = [pd.to_datetime(d) if d else None
+                            for d in dateLims]
+        dates = pd.DatetimeIndex(dates)
+        keep = np.ones(len(dates), dtype=bool)
+        if startLim:
+            keep &= dates >= startLim if inclusive else dates > startLim
+        if endLim:
+            keep &= dates <= endLim if inclusive else dates < endLim
+        return keep
+
+    def plotFoliumMap_traj(self, releases=None, geojson=True,
+                           smooth=1.0):
         '''
         Plots a simple map to take a quick look about trajectories. 
 
         Input:
-        - df        Dataframe with trajectories data. If None will
-                    use the data extracted on initialization.
         - releases  List of integers. References the releases numbers
                     to plot
+        - geojson   If True all the trajectories are drawn as a single
+                    GeoJSON layer (one MultiLineString for the lines
+                    and one point per release for the starts), which
+                    keeps the map light with thousands of releases.
+                    If False every release gets its own PolyLine and
+                    plane Marker.
+        - smooth    Simplification of the GeoJSON lines at every zoom
+                    level (Leaflet 'smoothFactor'). Higher values
+                    draw faster with less detail.
         '''
-        # Extract inner data
-        df = self.trajData.copy()
         # Specify the releases to plot
         if not releases:
-            releases = df['j'].unique()
-        # Create a dataframe with only the relevant releases
-        dfTemp = df[df['j'].isin(releases)]
+            releases = list(self.trajIndex)
+        import folium
         # Create the map
         m = folium.Map(location=[16.7219, -22.9488], tiles='Stamen Terrain',
                        zoom_start=5)
         # Add capacity to see lat/lon on click
         m.add_child(folium.LatLngPopup())
+        # == Single GeoJSON layer ===============================
+        if geojson:
+            self.get_trajLayer(releases, smooth=smooth).add_to(m)
+            return m
+        # == One layer per release ==============================
         # Iterate over releases
         for release in releases:
             # Extract a dataframe for the current release
-            df_rls = dfTemp[dfTemp['j'] == release]
+            df_rls = self.trajData.iloc[self.trajIndex[release]]
             # == Plot the first point as a dot ==================
             # Create the position
             pos = (df_rls.iloc[0]['ycenter'], df_rls.iloc[0]['xcenter'])
@@ -597,15 +2041,61 @@ class FLEXPARTOutput():
             folium.Marker(pos, popup, icon=icon).add_to(m)
             # == Plot the line ==================================
             # Recreate the positions as a tuple
-            pos = [(row['ycenter'], row['xcenter'])
-                   for idx, row in df_rls.iterrows()]
+            pos = list(zip(df_rls['ycenter'], df_rls['xcenter']))
             # Plot the line
             folium.PolyLine(pos, color='red', weight=2.5, opacity=1).add_to(m)
         # Return the result
         return m
 
+    def get_trajLayer(self, releases, smooth=1.0):
+        """
+        Build a folium FeatureGroup with the trajectories of
+        'releases' as two GeoJSON layers: a MultiLineString with
+        all the lines and the starting point of every release,
+        with its date shown on hover.
+
+        The coordinates are taken from the release index in one
+        go, without iterating over rows.
+        """
+        import folium
+        # == Prepare coordinates ================================
+        rows = [self.trajIndex[release] for release in releases]
+        # GeoJSON positions are (longitude, latitude)
+        coords = np.column_stack((self.trajData['xcenter'].values,
+                                  self.trajData['ycenter'].values))
+        lines = [coords[r].tolist() for r in rows]
+        starts = [r.start for r in rows]
+        dates = self.trajData['Date'].values[starts]
+        dates = pd.DatetimeIndex(dates).strftime('%Y-%m-%d %H:%M:%S')
+        # == Lines ==============================================
+        lineFeature = {'type': 'Feature', 'properties': {},
+                       'geometry': {'type': 'MultiLineString',
+                                    'coordinates': lines}}
+        lineStyle = {'color': 'red', 'weight': 2.5, 'opacity': 1}
+        layer = folium.FeatureGroup(name='Trajectories')
+        folium.GeoJson(lineFeature, style_function=lambda x: lineStyle,
+                       smooth_factor=smooth).add_to(layer)
+        # == Starting points ====================================
+        pointFeatures = [{'type': 'Feature',
+                          'properties': {'release': int(release),
+                                         'date': date},
+                          'geometry': {'type': 'Point',
+                                       'coordinates': coords[start].tolist()}}
+                         for release, start, date
+                         in zip(releases, starts, dates)]
+        points = {'type': 'FeatureCollection', 'features': pointFeatures}
+        marker = folium.CircleMarker(radius=4, color='black', fill=True,
+                                     fill_opacity=1)
+        tooltip = folium.GeoJsonTooltip(fields=['release', 'date'],
+                                        aliases=['Release',
+                                                 'Plane position at'])
+        folium.GeoJson(points, marker=marker, tooltip=tooltip).add_to(layer)
+        return layer
+
     def plotMap_plume(self, date, level=0, releases=None, extent=None,
-                      plumeLims=(0, None), savePath=None, dpi=200):
+                      plumeLims=(0, None), savePath=None, dpi=200,
+                      reuseMap=False, frame=None, releaseLims=None,
+                      render='contour'):
         """
         Plot a simple plume map from a FLEXPART simulation.
 
@@ -616,6 +2106,8 @@ class FLEXPARTOutput():
         date        Date to plot in format 'yyyy-mm-dd HH:MM'.
         level       Defines the height level to plot.
                     By defect is the lowest: 0.
+        releases    List of releases numbers (starting at 1) to
+                    plot. By default all of them are summed.
         extent      Define the map limits. Should be a list with
                     format [lon_min, lon_max, lat_min, lat_max].
                     By default it will use all points available.
@@ -623,50 +2115,56 @@ class FLEXPARTOutput():
                     source-receptor sensitivity colorbar.
         savePath    Saving name. Path can be included.
         dpi         Quality of picture saved .
+        reuseMap    If True, draw on the cached map with the same
+                    extent (see 'get_baseMap') instead of creating
+                    a new figure. The data of the previous call is
+                    removed from it.
+        frame       Time index of 'date' if already known (see
+                    'frames_for').
+        releaseLims Dates [start, end] to choose the releases to
+                    plot instead of 'releases' (see
+                    'get_releases_dateRange').
+        render      'contour' draws filled contours and their lines.
+                    'raster' draws the cells with the same colour
+                    levels as an image (pcolormesh), which is much
+                    faster on fine grids and keeps pdfs small.
         """
         # == Prepare data =======================================
         # Retrieve metaData
-        ds = self.ncData
-        dates = pd.Index(ds.time.values)
-        hgt = ds.height.to_series()
-        lat = ds.latitude.to_series()
-        lon = ds.longitude.to_series()
+        ds = self.ncData if self.ncLazy is None else self.ncLazy
+        if releaseLims is not None:
+            releases = self.get_releases_dateRange(releaseLims)
+        lat = self.ncCoords['latitude']
+        lon = self.ncCoords['longitude']
         # Convert input date to datetime
         date = pd.to_datetime(date)
         # Get the requested date index
-        idx = dates.get_loc(date, method='nearest')
+        if frame is None:
+            frame = self.frames_for(date)[0]
+        idx = frame
         # Extract the plume data
-        plume = ds[0, :, idx, level, :, :]
-        # We do not want distinction for each release, sum them
-        # ADD RELEASE DISTINCTION
-        plume = np.sum(plume, axis=0)
+        if releases is None and self.ncTotal is not None:
+            # Use the plume already summed over releases
+            plume = self.ncTotal[idx, level, :, :].values
+        else:
+            plume = ds[0, :, idx, level, :, :]
+            # Select the releases before reducing them
+            if releases is not None:
+                plume = plume.isel(pointspec=self.get_pointspec(releases))
+            # Only this slab is read from disk
+            plume = plume.sum(dim='pointspec').values
 
         # == Prepare figure =====================================
-        # Create figure and axes
-        set_style('ticks')
-        fig = plt.figure(figsize=(10, 8))
-        ax = plt.axes(projection=ccrs.PlateCarree())
-        # Find and stablish its limits
-        if extent:
-            ax.axis(extent)
-        else:
+        # Find the map limits
+        if not extent:
             lon_max = np.ceil(lon.max())
             lat_max = np.ceil(lat.max())
             lon_min = np.floor(lon.min())
             lat_min = np.floor(lat.min())
-            ax.axis([lon_min, lon_max, lat_min, lat_max])
-        # Draw coastlines
-        ax.coastlines('50m', linewidth=1, color='black')
-        # Prepare the grid
-        gd = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True,
-                          linewidth=1, linestyle='--', color='k',
-                          alpha=0.5)
-        gd.xlabels_top = False  # Take out upper labels
-        gd.ylabels_right = False  # Take out right labels
-        gd.xformatter = LONGITUDE_FORMATTER  # Format of lon ticks
-        gd.yformatter = LATITUDE_FORMATTER  # Format of lat ticks
-        gd.xlabel_style = {'size': 10, 'color': 'k'}
-        gd.ylabel_style = {'size': 10, 'color': 'k'}
+            extent = [lon_min, lon_max, lat_min, lat_max]
+        # Create figure and axes with coastlines and grid
+        fig, ax, artists = self.get_baseMap(extent, fsize=(10, 8),
+                                            reuse=reuseMap)
         # Set title
         ax.set_title(f'{date.strftime("%Y/%m/%d %H:%M")}', color='k')
 
@@ -684,39 +2182,70 @@ class FLEXPARTOutput():
             levels = np.linspace(pMin, pMax, 9)
         else:
             levels = 2
-        # Call contourf
-        c1 = ax.contourf(lon, lat, plume, cmap='jet', levels=levels,
-                         extend=extend)
-        # Call contour
-        c2 = ax.contour(lon, lat, plume, colors=('k',), levels=levels,
-                        linewidths=(.5,))
+        if render == 'raster':
+            # Draw the cells coloured by level, as an image
+            if np.ndim(levels) == 0:
+                levels = np.array([pMin, pMin+1])
+            cmap, norm = self.get_plumeNorm(levels, extend)
+            c1 = ax.pcolormesh(lon, lat, plume, cmap=cmap, norm=norm,
+                               shading='nearest', rasterized=True)
+            c2 = None
+        else:
+            # Call contourf
+            c1 = ax.contourf(lon, lat, plume, cmap='jet', levels=levels,
+                             extend=extend)
+            # Call contour
+            c2 = ax.contour(lon, lat, plume, colors=('k',), levels=levels,
+                            linewidths=(.5,))
+            # Define colors outside boundaries
+            c1.cmap.set_under('white')
 
         # == Make the colorbar ==================================
-        # Define colors outside boundaries
-        c1.cmap.set_under('white')
         # If there is no data, will throw an error. Use a try
+        cb = None
         try:
-            cb = fig.colorbar(c1, format='%.1f')
+            cb = fig.colorbar(c1, format='%.1f', extend=extend)
             cb.set_label('Source-Receptor Relationship (s)', color='k')
             cb.set_tick_params(color='k')
         except:
             pass
+        # Note down the data to remove it if the map is reused
+        artists += [a for a in (c1, c2, cb) if a is not None]
         if savePath:
             fig.savefig(savePath, dpi=dpi,
                         bbox_inches='tight', transparent=True)
         return (fig, ax, c1, c2, cb)
 
+    def get_plumeNorm(self, levels, extend):
+        """
+        Return the colormap and the BoundaryNorm used by the
+        'raster' render of 'plotMap_plume' for the given levels,
+        with the same colours as the filled contours. They are
+        built once for every set of levels.
+        """
+        key = (tuple(levels), extend)
+        if key not in self.plumeNorms:
+            import matplotlib.pyplot as plt
+            from matplotlib.colors import BoundaryNorm
+            cmap = plt.get_cmap('jet').copy()
+            cmap.set_under('white')
+            norm = BoundaryNorm(levels, cmap.N, extend=extend)
+            self.plumeNorms[key] = (cmap, norm)
+        return self.plumeNorms[key]
+
     def plotPdfMap_plume(self, saveName=None, releases=None, level=0,
                          plumeLims=(0.1, None), dateLims=[None, None],
-                         freq='H', extent=None, dpi=200):
+                         freq='H', extent=None, dpi=200, cache=False,
+                         workers=None, reuseMap=True, releaseLims=None,
+                         render='contour'):
         """
         Create a pdf with hourly plots about the plume output
         from FLEXPART. The pdf will be saved in the output directory.
 
         Input:
         - saveName      Name to use when saving the pdf.
-        - releases      Defines the range of releases to be plotted.
-                        (NOT IMPLEMENTED YET)
+        - releases      List of releases numbers (starting at 1) to
+                        plot. By default all of them are summed.
         - level         Defines the height level to plot.
                         By defect is the lowest: 0.
         - plumeLims     Defines the limits values for the 
@@ -728,39 +2257,359 @@ class FLEXPARTOutput():
         - extent        Define the map limits. Should be a list with
                         format [lon_min, lon_max, lat_min, lat_max].
                         By default it will use all points available.
+        - cache         If True, sum the plume over releases once with
+                        'load_plume_total' before plotting the frames.
+        - workers       Number of processes used to render the frames.
+                        Each frame is saved as a one page pdf and the
+                        pages are joined in date order (requires 'pypdf').
+                        By default frames are rendered one by one.
+                        On Windows, call it under "if __name__ == 
+                        '__main__':".
+        - reuseMap      If True, coastlines and grid are drawn once and
+                        only the plume is redrawn for every frame.
+        - releaseLims   Dates [start, end] to choose the releases to
+                        plot instead of 'releases' (see
+                        'get_releases_dateRange').
+        - render        'contour' or 'raster' (see 'plotMap_plume').
         """
+        # Choose the releases once for every frame
+        if releaseLims is not None:
+            releases = self.get_releases_dateRange(releaseLims)
+        # Check them before plotting any frame
+        if releases is not None:
+            self.get_pointspec(releases)
+        # Sum the releases once for every frame
+        if cache and releases is None and self.ncTotal is None:
+            self.load_plume_total()
         # Retrieve metaData
-        ds = self.ncData
-        dates = pd.Index(ds.time.values)
-        hgt = ds.height.to_series()
-        lat = ds.latitude.to_series()
-        lon = ds.longitude.to_series()
-        # ADD RELEASES RESTRICTION
+        dates = self.ncCoords['time']
+        hgt = self.ncCoords['height']
         # Define the date range (Assuming it's backwards)
-        if dateLims[0]:
-            dateLims[0] = pd.to_datetime(dateLims[0])
-        else:
-            dateLims[0] = pd.to_datetime(dates[-1])
-        if dateLims[1]:
-            dateLims[1] = pd.to_datetime(dateLims[1])
-        else:
-            dateLims[1] = pd.to_datetime(dates[0])
-        dateRange = pd.date_range(dateLims[0], end=dateLims[1], freq=freq)
-        # Open a pdf
+        startLim, endLim = dateLims
+        startLim = pd.to_datetime(startLim if startLim else dates[-1])
+        endLim = pd.to_datetime(endLim if endLim else dates[0])
+        dateRange = pd.date_range(startLim, end=endLim, freq=freq)
+        # Find the time index of every frame at once
+        frames = self.frames_for(dateRange)
+        # Define the saving name
         if not saveName:
             saveName = f'quickMap_plume_{int(hgt[level])}m.pdf'
-        with PdfPages(self.outputDir+saveName) as pdf:
-            # Iterate over date range
-            for date in dateRange:
-                # Call 'plotMap_plume'
-                figData = self.plotMap_plume(date, level=level,
-                                             releases=releases,
-                                             extent=extent, dpi=dpi,
-                                             plumeLims=plumeLims)
-                # Tighthen it and save to pdf
-                pdf.savefig(dpi=200, bbox_inches='tight', transparent=True)
-                # Close the existing figure to avoid memory overload
-                plt.close()
+        savePath = self.outputDir+saveName
+        plotArgs = {'level': level, 'releases': releases, 'extent': extent,
+                    'dpi': dpi, 'plumeLims': plumeLims, 'reuseMap': reuseMap,
+                    'render': render}
+        with self.stage('render', method='plotPdfMap_plume',
+                        frames=len(dateRange)) as info:
+            if workers and workers > 1:
+                self.render_pdf_parallel(savePath, dateRange, frames,
+                                         plotArgs, workers)
+            else:
+                self.render_pdf(savePath, dateRange, frames, plotArgs)
+            info['written'] = lambda: os.path.getsize(savePath)
+
+    def render_pdf_parallel(self, savePath, dateRange, frames, plotArgs,
+                            workers):
+        """
+        Render the frames of 'plotPdfMap_plume' in a pool of
+        'workers' processes and join the pages in 'savePath'.
+        """
+        from pypdf import PdfWriter
+        # Send to the workers only the netCDF data
+        FPFrames = FLEXPARTOutput(self.outputDir)
+        FPFrames.ncFiles = self.ncFiles
+        FPFrames.ncData = self.ncData
+        FPFrames.ncTotal = self.ncTotal
+        FPFrames.ncCoords = self.ncCoords
+        FPFrames.ncLazy = self.ncLazy
+        # Forking a process with open netCDF files may hang
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context,
+                                 initializer=_init_frame_worker,
+                                 initargs=(FPFrames,)) as pool:
+            pages = pool.map(_render_plume_frame, dateRange, frames,
+                             repeat(plotArgs))
+            # map keeps the order of the dates
+            writer = PdfWriter()
+            for page in pages:
+                writer.append(io.BytesIO(page))
+        with open(savePath, 'wb') as f:
+            writer.write(f)
+
+    def render_pdf(self, savePath, dateRange, frames, plotArgs):
+        """
+        Render the frames of 'plotPdfMap_plume' one after another
+        in 'savePath'.
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_pdf import PdfPages
+        # Maps reused only by these frames are closed at the end
+        baseMaps = set(self.baseMaps)
+        # Open a pdf
+        try:
+            with PdfPages(savePath) as pdf:
+                # Iterate over date range
+                for date, frame in zip(dateRange, frames):
+                    # Call 'plotMap_plume'
+                    figData = self.plotMap_plume(date, frame=frame,
+                                                 **plotArgs)
+                    # Tighthen it and save to pdf
+                    pdf.savefig(figData[0], dpi=200, bbox_inches='tight',
+                                transparent=True)
+                    # Close the existing figure to avoid memory overload
+                    if not plotArgs['reuseMap']:
+                        plt.close(figData[0])
+        finally:
+            self.close_baseMaps([key for key in self.baseMaps
+                                 if key not in baseMaps])
+
+
+class FLEXPARTCampaign():
+    """
+    Handle the output of a campaign split in several FLEXPART
+    runs, one output directory per run (for instance one per
+    flight leg).
+
+    The directories are scanned with a pool of threads, as on
+    networked filesystems most of the time is spent waiting for
+    each directory. The netCDF files are opened one after another
+    (the netCDF/HDF5 library is not thread-safe) and the
+    trajectory files are parsed in a pool of processes. The
+    seconds spent on every run are noted down in 'timings'.
+
+    The combined trajectories are the same as the ones saved by
+    'FLEXPARTOutput.combine_trajectories'.
+    """
+
+    def __init__(self, runDirs, threads=16, workers=None):
+        """
+        Initialize the class attributes
+
+        Input:
+        - runDirs   List of FLEXPART output directories.
+        - threads   Number of threads to scan the runs.
+        - workers   Number of processes to parse the trajectories.
+                    By default one per CPU. With 1, they are parsed
+                    in this process.
+        """
+        self.runDirs = [os.path.abspath(d) for d in runDirs]
+        self.threads = threads
+        self.workers = workers
+        # Used for the methods shared with single runs
+        self.FPOut = FLEXPARTOutput(self.runDirs[0]+'/')
+        # Initialize variables
+        self.runs = None
+        self.timings = pd.DataFrame(index=pd.Index(self.runDirs,
+                                                   name='runDir'))
+        self.trajData = None
+        self.trajDataMeta = None
+        self.ncData = None
+
+    def scan(self):
+        """
+        List the output directories concurrently and note down the
+        trajectories, netCDF and header files of every run in the
+        DataFrame 'runs', indexed by directory.
+        """
+        logger.info(f"Scanning {len(self.runDirs)} output directories... ")
+        with ThreadPoolExecutor(self.threads) as pool:
+            runs = list(pool.map(_scan_run, self.runDirs,
+                                 repeat(self.FPOut)))
+        self.runs = pd.DataFrame(runs).set_index('runDir')
+        self.timings['scan'] = self.runs.pop('elapsed')
+        # Show success message
+        self.print_timing('scan')
+        return self.runs
+
+    def load_trajectories(self):
+        """
+        Parse the trajectories file of every run in a pool of
+        processes and combine them (see 'concat_trajectories').
+        The result is saved in 'trajData' and 'trajDataMeta'.
+        """
+        if self.runs is None:
+            self.scan()
+        trajFiles = self.runs['trajFile'].dropna()
+        if len(trajFiles) == 0:
+            raise FileNotFoundError('No trajectories files found.')
+        logger.info(f"Parsing {len(trajFiles)} trajectories files... ")
+        if self.workers == 1:
+            results = [_extract_run_traj(f) for f in trajFiles]
+        else:
+            with ProcessPoolExecutor(self.workers) as pool:
+                # map keeps the order of the runs
+                results = list(pool.map(_extract_run_traj, trajFiles))
+        frames = [(df, df_meta) for df, df_meta, elapsed in results]
+        self.timings.loc[trajFiles.index, 'trajectories'] = \
+            [elapsed for df, df_meta, elapsed in results]
+        self.trajData, self.trajDataMeta = \
+            self.FPOut.concat_trajectories(frames)
+        # Show success message
+        self.print_timing('trajectories')
+
+    def load_netcdf(self, chunks=None):
+        """
+        Open the netCDF file of every run and concatenate them
+        along releases ('pointspec'). The data stays on disk until
+        it is needed (see 'extract_nc'). The result is saved in
+        'ncData'.
+
+        The files are opened one at a time: the netCDF/HDF5
+        library is not thread-safe.
+        """
+        if self.runs is None:
+            self.scan()
+        ncFiles = self.runs['ncFile'].dropna()
+        if len(ncFiles) == 0:
+            raise FileNotFoundError('No netCDF files found.')
+        logger.info(f"Opening {len(ncFiles)} netCDF files... ")
+
+        def open_run(ncFile):
+            t0 = time.perf_counter()
+            data = self.FPOut.extract_nc(ncFile, chunks=chunks)
+            return data, time.perf_counter()-t0
+
+        results = [open_run(ncFile) for ncFile in ncFiles]
+        self.timings.loc[ncFiles.index, 'netcdf'] = \
+            [elapsed for data, elapsed in results]
+        self.ncData = xr.concat([data for data, elapsed in results],
+                                dim='pointspec')
+        # Show success message
+        self.print_timing('netcdf')
+
+    def combine_trajectories(self, saveDir, fmt=None):
+        """
+        Save the combined trajectories as 'combine_trajectories'
+        of FLEXPARTOutput does, in 'output_processed/' inside
+        'saveDir'. Return the new location.
+        """
+        fmt = self.FPOut.table_format(fmt)
+        if self.trajData is None:
+            self.load_trajectories()
+        outputDir = os.path.abspath(f'{saveDir}/output_processed/')
+        if not os.path.exists(outputDir):
+            os.makedirs(outputDir)
+        self.FPOut.write_table(self.trajData,
+                               f'{outputDir}/trajectories_data.{fmt}')
+        self.FPOut.write_table(self.trajDataMeta,
+                               f'{outputDir}/trajectories_metaData.{fmt}')
+        return outputDir
+
+    def print_timing(self, step):
+        """
+        Log the total and slowest time of a step over the runs.
+        """
+        times = self.timings[step].dropna()
+        logger.info(f' {len(times)} runs in {times.sum():.2f} s of work, '
+                    + f'slowest {times.max():.2f} s ({times.idxmax()}).')
+
+
+# == Instrumentation ========================================
+def reset_peak_memory():
+    """
+    Reset the peak resident memory of the process, so it can be
+    measured for a single stage. Only available on Linux.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_memory():
+    """
+    Return the peak resident memory of the process in MB since
+    the last 'reset_peak_memory', or None where it is not
+    available (outside Linux).
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1])/1024, 1)
+    except OSError:
+        return None
+
+
+def disk_size(path):
+    """
+    Return the bytes on disk of a file or of a directory (Zarr
+    stores) and its contents.
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, dirs, files in os.walk(path) for f in files)
+# ===========================================================
+
+
+# == Parallel loading =======================================
+def _scan_run(runDir, FPOut):
+    """
+    List an output directory and return the files of the run
+    and the seconds it took. 'FPOut' is the FLEXPARTOutput used
+    to find the netCDF file.
+    """
+    t0 = time.perf_counter()
+    files = sorted(os.listdir(runDir))
+    trajFiles = [f for f in files if f.startswith('traj')]
+    try:
+        ncFile = FPOut.find_netcdf(runDir, files)
+    except FileNotFoundError:
+        ncFile = None
+    run = {'runDir': runDir,
+           'trajFile': f'{runDir}/{trajFiles[0]}' if trajFiles else None,
+           'ncFile': ncFile,
+           'header': f'{runDir}/header' if 'header' in files else None,
+           'nFiles': len(files)}
+    run['elapsed'] = time.perf_counter()-t0
+    return run
+
+
+def _extract_run_traj(trajFile):
+    """
+    Parse the trajectories file of a run in a worker process.
+    Return the data, the metadata and the seconds it took.
+    """
+    t0 = time.perf_counter()
+    FPOut = FLEXPARTOutput(os.path.dirname(trajFile)+'/')
+    df, df_meta = FPOut.extract_traj(trajFile)
+    return df, df_meta, time.perf_counter()-t0
+# ===========================================================
+
+
+# == Parallel rendering =====================================
+# Instance used by each worker of 'plotPdfMap_plume'
+_frameWorker = None
+
+
+def _init_frame_worker(FPOut):
+    """
+    Prepare a worker process to render plume frames with its
+    own non-interactive matplotlib backend.
+    """
+    global _frameWorker
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+    _frameWorker = FPOut
+
+
+def _render_plume_frame(date, frame, plotArgs):
+    """
+    Render one frame of 'plotPdfMap_plume' and return it as
+    the bytes of a one page pdf.
+    """
+    import matplotlib.pyplot as plt
+    figData = _frameWorker.plotMap_plume(date, frame=frame, **plotArgs)
+    buffer = io.BytesIO()
+    figData[0].savefig(buffer, format='pdf', dpi=200, bbox_inches='tight',
+                       transparent=True)
+    # A reused map is kept for the next frames of this worker, and
+    # goes away with the worker process at the end of the pool
+    if not plotArgs.get('reuseMap'):
+        plt.close(figData[0])
+    return buffer.getvalue()
+# ===========================================================
 
 
 def testing():
@@ -817,7 +2666,7 @@ def testing():
     # # Restrict the releases range
     # dateLims = ['2017-08-28 00:00', '2017-08-28 02:00']
     # dateRange = FPOut.get_traj_dateRange(show=True, dateLims=dateLims)
-    # m = FPOut.plotFoliumMap_traj(releases=dateRange.keys())
+    # m = FPOut.plotFoliumMap_traj(releases=dateRange.index.tolist())
     # m.save(runDir+'map_1.html')
 
     # # == Single netcdf maps =====================================
@@ -0,0 +1,953 @@
+# !usr/bin/env python3
+# ===========================================================
+# Created on 16/10/2026
+# Benchmarks for the most expensive parts of FLEXPARTOutput.
+# Every benchmark builds its own synthetic data in a
+# temporary directory, so no real FLEXPART output is needed.
+#
+# Usage:
+#  python benchmark_FPOutput.py                  (all of them)
+#  python benchmark_FPOutput.py suite render     (some of them)
+#  python benchmark_FPOutput.py suite --save base.csv
+#  python benchmark_FPOutput.py suite --baseline base.csv
+# ===========================================================
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import matplotlib.pyplot as plt
+
+from netCDF4 import Dataset
+from matplotlib.backends.backend_pdf import PdfPages
+
+from FLEXPARTOutput import FLEXPARTOutput, FLEXPARTCampaign
+
+
+# == Synthetic data =========================================
+def write_trajectories(filePath, nReleases=5000, nSteps=24,
+                       stepSeconds=3600):
+    """
+    Write a synthetic 'trajectories.txt' file with the same
+    layout as the one produced by FLEXPART.
+
+    Rows are written as FLEXPART does: one block per output
+    time containing every release.
+    """
+    rng = np.random.default_rng(0)
+    with open(filePath, 'w') as f:
+        # == Header =============================================
+        f.write('20170831  120000 Version 10.2beta (2017-08-01)\n')
+        f.write('           0           0           1\n')
+        f.write(f'{nReleases:12d}\n')
+        # == Releases metadata ==================================
+        for i in range(nReleases):
+            tStart = -60*i
+            f.write(f'{tStart:12d}{tStart-60:12d}'
+                    + '   -24.0000000       16.0000000'
+                    + '   -23.9000000       16.1000000'
+                    + '    5000.00000       5100.00000'
+                    + f'          1       10000\n')
+            f.write(f'SYNTHETIC RELEASE R{nReleases-i} CAFE FLIGHT\n')
+        # == Trajectories =======================================
+        for step in range(nSteps):
+            t = -stepSeconds*step
+            data = rng.random((nReleases, 39))*100
+            for j in range(nReleases):
+                values = ' '.join(f'{v:8.3f}' for v in data[j])
+                f.write(f'{j+1:5d}{t:8d} {values}\n')
+
+
+def write_netcdf(filePath, nReleases=10, nTimes=24, nHeights=4,
+                 nLat=65, nLon=85, zeros=0.0):
+    """
+    Write a synthetic netCDF file with a 'spec001_mr' variable
+    shaped as the one produced by FLEXPART:
+    (nageclass, pointspec, time, height, latitude, longitude)
+
+    A fraction 'zeros' of the cells is left empty, as in real
+    footprints. Return the DataArray written.
+    """
+    rng = np.random.default_rng(0)
+    # Backwards simulation, times are decreasing
+    time = pd.date_range('2017-08-31 12:00', periods=nTimes,
+                         freq='-1H')
+    coords = {'time': time,
+              'height': np.linspace(100, 5000, nHeights, dtype='f4'),
+              'latitude': np.linspace(-14.5, 44.5, nLat, dtype='f4'),
+              'longitude': np.linspace(-39.5, 19.5, nLon, dtype='f4')}
+    shape = (1, nReleases, nTimes, nHeights, nLat, nLon)
+    data = rng.gamma(0.5, 2, size=shape).astype('f4')
+    data[rng.random(shape) < zeros] = 0
+    spec = xr.DataArray(data, coords=coords, name='spec001_mr',
+                        dims=('nageclass', 'pointspec', 'time', 'height',
+                              'latitude', 'longitude'))
+    encoding = {'spec001_mr': {'zlib': True, 'complevel': 1,
+                               'chunksizes': (1, 1, 1, nHeights,
+                                              nLat, nLon)}}
+    spec.to_dataset().to_netcdf(filePath, encoding=encoding)
+    return spec
+
+
+def write_netcdf_large(filePath, nReleases=16, nTimes=240, nHeights=4,
+                       nLat=180, nLon=180):
+    """
+    Write a synthetic 'spec001_mr' netCDF file one time step at a
+    time, so files larger than the memory can be built. It is
+    chunked as FLEXPART does, one (height, lat, lon) block per
+    release and time step. Without compression, every release adds
+    nTimes*nHeights*nLat*nLon*4 bytes (~124 MB with the defaults).
+    """
+    rng = np.random.default_rng(0)
+    with Dataset(filePath, 'w') as nc:
+        for dim, size in [('nageclass', 1), ('pointspec', nReleases),
+                          ('time', nTimes), ('height', nHeights),
+                          ('latitude', nLat), ('longitude', nLon)]:
+            nc.createDimension(dim, size)
+        time = nc.createVariable('time', 'i4', ('time',))
+        time.units = 'seconds since 2017-08-31 12:00'
+        time[:] = -3600*np.arange(1, nTimes+1)
+        for dim, values in [('height', np.linspace(100, 5000, nHeights)),
+                            ('latitude', np.linspace(-45, 45, nLat)),
+                            ('longitude', np.linspace(-45, 45, nLon))]:
+            nc.createVariable(dim, 'f4', (dim,))[:] = values
+        spec = nc.createVariable('spec001_mr', 'f4',
+                                 ('nageclass', 'pointspec', 'time',
+                                  'height', 'latitude', 'longitude'),
+                                 chunksizes=(1, 1, 1, nHeights, nLat,
+                                             nLon))
+        for t in range(nTimes):
+            spec[0, :, t] = rng.gamma(0.5, 2, size=(nReleases, nHeights,
+                                                    nLat, nLon))
+
+
+def write_record(f, *items):
+    """
+    Write the bytes of 'items' as one Fortran unformatted record.
+    """
+    data = b''.join(np.asarray(item).tobytes() if not isinstance(
+        item, bytes) else item for item in items)
+    recLen = np.int32(len(data)).tobytes()
+    f.write(recLen+data+recLen)
+
+
+def write_header(filePath, spec, species='AIRTRACER'):
+    """
+    Write a binary 'header' file describing the grid of 'spec',
+    a 'spec001_mr' DataArray as the one of 'write_netcdf', with
+    the record layout of FLEXPART 10.
+    """
+    nAge, nPoint = spec.shape[:2]
+    lon, lat = spec.longitude.values, spec.latitude.values
+    dx, dy = lon[1]-lon[0], lat[1]-lat[0]
+    date = pd.to_datetime(spec.time.values[0])
+    i4 = np.int32
+    with open(filePath, 'wb') as f:
+        write_record(f, i4(date.strftime('%Y%m%d')),
+                     i4(date.strftime('%H%M%S')),
+                     b'Version 10.2beta (2017-08-01)'.ljust(256))
+        write_record(f, np.array([-3600, -3600, -900], 'i4'))
+        write_record(f, np.array([lon[0]-dx/2, lat[0]-dy/2], 'f4'),
+                     np.array([len(lon), len(lat)], 'i4'),
+                     np.array([dx, dy], 'f4'))
+        write_record(f, i4(spec.height.size),
+                     spec.height.values.astype('f4'))
+        write_record(f, i4(date.strftime('%Y%m%d')),
+                     i4(date.strftime('%H%M%S')))
+        write_record(f, np.array([3, nPoint], 'i4'))
+        write_record(f, i4(1), f'WD_{species[:7]}'.ljust(10).encode())
+        write_record(f, i4(1), f'DD_{species[:7]}'.ljust(10).encode())
+        write_record(f, i4(spec.height.size), species.ljust(10).encode())
+        write_record(f, i4(nPoint))
+        for i in range(nPoint):
+            write_record(f, np.array([-3600*i, -3600*i-60], 'i4'),
+                         np.int16(1))
+            write_record(f, np.array([-24, 16, -23.9, 16.1, 5000, 5100],
+                                     'f4'))
+            write_record(f, np.array([10000, 1], 'i4'))
+            write_record(f, f'RELEASE {i+1}'.ljust(45).encode())
+            for j in range(3):
+                write_record(f, np.float32(1e8))
+        write_record(f, np.array([0, 0, 1, 1, 1], 'i4'))
+        write_record(f, np.array([nAge, 999999999], 'i4'))
+        for ix in range(len(lon)):
+            write_record(f, np.zeros(len(lat), 'f4'))
+
+
+def encode_sparse(field, offset=0):
+    """
+    Encode a field in the sparse format of FLEXPART: the flat
+    index of the first cell of every run of non-zero cells
+    (plus 'offset') and their values, flipping the sign from
+    one run to the next.
+    """
+    flat = np.ravel(field)
+    cells = np.flatnonzero(flat > 0)
+    newRun = np.diff(cells, prepend=-2) != 1
+    sign = np.where(np.cumsum(newRun) % 2 == 1, 1, -1)
+    return ((cells[newRun]+offset).astype('i4'),
+            (flat[cells]*sign).astype('f4'))
+
+
+def write_grid_binary(outputDir, spec, prefix='grid_time'):
+    """
+    Write the binary sparse grid files ('grid_time_<date>_001')
+    of 'spec', a 'spec001_mr' DataArray, together with the
+    'header' file needed to read them.
+    """
+    write_header(os.path.join(outputDir, 'header'), spec)
+    nAge, nPoint = spec.shape[:2]
+    nLat, nLon = spec.shape[-2:]
+    for t, date in enumerate(pd.to_datetime(spec.time.values)):
+        fileName = f'{prefix}_{date.strftime("%Y%m%d%H%M%S")}_001'
+        frame = spec[:, :, t].values
+        with open(os.path.join(outputDir, fileName), 'wb') as f:
+            write_record(f, np.int32(-3600*t))
+            for kp in range(nPoint):
+                for age in range(nAge):
+                    # Empty depositions, then the concentrations
+                    fields = [encode_sparse(np.zeros((nLat, nLon))),
+                              encode_sparse(np.zeros((nLat, nLon))),
+                              encode_sparse(frame[age, kp],
+                                            offset=nLat*nLon)]
+                    for starts, values in fields:
+                        write_record(f, np.int32(len(starts)))
+                        write_record(f, starts)
+                        write_record(f, np.int32(len(values)))
+                        write_record(f, values)
+
+
+def write_partposit(filePath, itime, nParticles=10000, nReleases=10,
+                    nSpecies=1):
+    """
+    Write a synthetic 'partposit_<date>' dump with 'nParticles'
+    particles spread over 'nReleases' releases, with the record
+    layout read by 'extract_partposit'.
+    """
+    rng = np.random.default_rng(abs(itime))
+    dtype = np.dtype([('_rec0', '<i4'), ('npoint', '<i4'),
+                      ('xlon', '<f4'), ('ylat', '<f4'), ('z', '<f4'),
+                      ('itramem', '<i4'), ('topo', '<f4'), ('pv', '<f4'),
+                      ('qv', '<f4'), ('rho', '<f4'), ('hmix', '<f4'),
+                      ('tr', '<f4'), ('tt', '<f4'),
+                      ('xmass', '<f4', (nSpecies,)), ('_rec1', '<i4')])
+    # The last record only flags the end of the file
+    parts = np.zeros(nParticles+1, dtype=dtype)
+    parts['_rec0'] = parts['_rec1'] = dtype.itemsize-8
+    parts['npoint'][:-1] = rng.integers(1, nReleases+1, nParticles)
+    parts['npoint'][-1] = -99999
+    parts['xlon'] = rng.uniform(-40, 20, nParticles+1)
+    parts['ylat'] = rng.uniform(-15, 45, nParticles+1)
+    parts['z'] = rng.uniform(0, 5000, nParticles+1)
+    parts['itramem'] = -3600*(parts['npoint']-1)
+    parts['rho'] = 1.2
+    parts['tt'] = rng.uniform(220, 300, nParticles+1)
+    parts['xmass'] = 1.0
+    with open(filePath, 'wb') as f:
+        write_record(f, np.int32(itime))
+        f.write(parts.tobytes())
+
+
+def write_receptors(filePath, nReceptors=1000, nTimes=240, nSpecies=1):
+    """
+    Write a synthetic 'receptor_conc' file with 'nReceptors'
+    receptors and 'nTimes' hourly outputs. Return the values
+    written (time, species, receptor).
+    """
+    rng = np.random.default_rng(0)
+    names = np.array([f'R{i:06d}'.ljust(16) for i in range(nReceptors)],
+                     dtype='S16')
+    positions = rng.uniform(-40, 40, (nReceptors, 2)).astype('f4')
+    values = rng.gamma(0.5, 2, (nTimes, nSpecies, nReceptors)).astype('f4')
+    specDtype = np.dtype([('_rec0', '<i4'), ('values', '<f4', (nReceptors,)),
+                          ('_rec1', '<i4')])
+    steps = np.zeros(nTimes, dtype=[('_rec0', '<i4'), ('itime', '<i4'),
+                                    ('_rec1', '<i4'),
+                                    ('spec', specDtype, (nSpecies,))])
+    steps['_rec0'] = steps['_rec1'] = 4
+    steps['itime'] = 3600*np.arange(1, nTimes+1)
+    steps['spec']['_rec0'] = steps['spec']['_rec1'] = 4*nReceptors
+    steps['spec']['values'] = values
+    with open(filePath, 'wb') as f:
+        write_record(f, names)
+        write_record(f, positions)
+        f.write(steps.tobytes())
+    return values
+
+
+def write_output_dir(outputDir, nReleases=10, nTimes=24, nHeights=4,
+                     nLat=65, nLon=85, zeros=0.5, nParticles=0,
+                     nReceptors=0, binary=False):
+    """
+    Write a synthetic FLEXPART output directory with the files
+    read by FLEXPARTOutput:
+    - 'trajectories.txt' with 'nReleases' releases and one step
+      per output time.
+    - 'grid_time_<date>.nc' shaped (1, nReleases, nTimes,
+      nHeights, nLat, nLon), or the binary 'grid_time_<date>_001'
+      files if 'binary' is True.
+    - The binary 'header'.
+    - One 'partposit_<date>' dump per output time with
+      'nParticles' particles (none by default).
+    - A 'receptor_conc' file with 'nReceptors' receptors (none
+      by default).
+
+    Return the path of the directory.
+    """
+    os.makedirs(outputDir, exist_ok=True)
+    write_trajectories(os.path.join(outputDir, 'trajectories.txt'),
+                       nReleases=nReleases, nSteps=nTimes)
+    ncFile = os.path.join(outputDir, 'grid_time_20170831120000.nc')
+    spec = write_netcdf(ncFile, nReleases=nReleases, nTimes=nTimes,
+                        nHeights=nHeights, nLat=nLat, nLon=nLon,
+                        zeros=zeros)
+    if binary:
+        os.remove(ncFile)
+        write_grid_binary(outputDir, spec)
+    else:
+        write_header(os.path.join(outputDir, 'header'), spec)
+    if nParticles:
+        for t, date in enumerate(pd.to_datetime(spec.time.values)):
+            fileName = f'partposit_{date.strftime("%Y%m%d%H%M%S")}'
+            write_partposit(os.path.join(outputDir, fileName), -3600*t,
+                            nParticles=nParticles, nReleases=nReleases)
+    if nReceptors:
+        write_receptors(os.path.join(outputDir, 'receptor_conc'),
+                        nReceptors=nReceptors, nTimes=nTimes)
+    return outputDir
+# ===========================================================
+
+
+# == Reference implementations ==============================
+def legacy_extract_traj_data(trajFile, metaRows, df_meta, names):
+    """
+    Former implementation of 'extract_traj_data', kept to
+    measure the speedup of the vectorized parser.
+    """
+    df = pd.read_csv(trajFile, engine='python', sep=r'\s+',
+                     skiprows=metaRows+3, header=None, names=names)
+    df_list = []
+    for release in df['j'].unique():
+        df_temp = df[df['j'] == release].copy()
+        release_date = df_meta[df_meta['j'] == release]['Date'].values
+        df_temp['Date'] = release_date + \
+            pd.to_timedelta(df_temp['t'].astype(int), 'S').values
+        df_list.append(df_temp)
+    return pd.concat(df_list, ignore_index=True)
+
+
+def legacy_get_traj_dateRange(df):
+    """
+    Former loop of 'get_traj_dateRange', scanning the whole
+    dataframe for every release.
+    """
+    df = df.copy()
+    releases = df['j'].unique()
+    dfTemp = df[df['j'].isin(releases)]
+    dateRange = {}
+    for release in releases:
+        dateTemp = dfTemp[dfTemp['j'] == release]['Date']
+        dateRange[release] = (dateTemp.min(), dateTemp.max())
+    return dateRange
+
+
+def legacy_plotMap_traj(FPOut, extent):
+    """
+    Former loop of 'plotMap_traj', with two artists per release.
+    """
+    fig, ax, artists = FPOut.get_baseMap(extent, fsize=(12, 10))
+    for release in FPOut.trajIndex:
+        df_rls = FPOut.trajData.iloc[FPOut.trajIndex[release]]
+        ax.plot(df_rls.iloc[0]['xcenter'], df_rls.iloc[0]['ycenter'], 'ko')
+        ax.plot(df_rls['xcenter'], df_rls['ycenter'],
+                color='red', linestyle='--')
+    return (fig, ax)
+# ===========================================================
+
+
+# == Benchmarks =============================================
+def timeit(func, *args, repeat=1, **kwargs):
+    """
+    Return the best wall time of 'repeat' calls and the
+    result of the last one.
+    """
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter()-t0)
+    return best, result
+
+
+def bench_extract_traj(nReleases=5000):
+    """
+    Compare the vectorized trajectories parser against the
+    former python engine and per-release loop.
+    """
+    print(f'\n== extract_traj ({nReleases} releases) ==')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        trajFile = os.path.join(tmpDir, 'trajectories.txt')
+        write_trajectories(trajFile, nReleases=nReleases)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        # Time the new parser
+        tNew, (df, df_meta) = timeit(FPOut.extract_traj, trajFile)
+        # Time the former parser on the same file
+        metaRows = 2*nReleases
+        names = list(df.columns[:-1])
+        tOld, dfOld = timeit(legacy_extract_traj_data, trajFile,
+                             metaRows, df_meta, names)
+    # Both parsers must agree
+    pd.testing.assert_frame_equal(df, dfOld)
+    print(f' Former parser:     {tOld:8.3f} s')
+    print(f' Vectorized parser: {tNew:8.3f} s')
+    print(f' Speedup:           {tOld/tNew:8.1f}x')
+    return tOld, tNew
+
+
+def bench_traj_index(nReleases=2000, nSteps=24):
+    """
+    Time the release date ranges of 'get_traj_dateRange' with
+    boolean masks against a grouped min/max, and a date window
+    query once the ranges are known.
+    """
+    print(f'\n== Release index ({nReleases} releases) ==')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_trajectories(os.path.join(tmpDir, 'trajectories.txt'),
+                           nReleases=nReleases, nSteps=nSteps)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        tIndex, _ = timeit(FPOut.load_trajectories)
+    tOld, rangeOld = timeit(legacy_get_traj_dateRange, FPOut.trajData)
+    tNew, rangeNew = timeit(FPOut.get_traj_dateRange)
+    # Both must agree
+    assert rangeOld == {j: (a, z) for j, a, z in rangeNew.itertuples()}
+    # Restrict to a window once the ranges are known
+    dateLims = [rangeNew['start'].quantile(0.25),
+                rangeNew['start'].quantile(0.75)]
+    tQuery, _ = timeit(FPOut.get_traj_dateRange, dateLims=dateLims,
+                       repeat=5)
+    print(f' Load (including index): {tIndex:8.3f} s')
+    print(f' Boolean masks:          {tOld:8.3f} s')
+    print(f' Grouped min/max:        {tNew:8.3f} s')
+    print(f' Speedup:                {tOld/tNew:8.1f}x')
+    print(f' Date window query:      {tQuery*1000:8.3f} ms')
+    return tOld, tNew
+
+
+def bench_traj_map(nReleases=3000, nSteps=24):
+    """
+    Time drawing and saving the trajectories map with one
+    artist per release against a single LineCollection, and
+    the peak memory of each.
+    """
+    print(f'\n== plotMap_traj ({nReleases} releases) ==')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_trajectories(os.path.join(tmpDir, 'trajectories.txt'),
+                           nReleases=nReleases, nSteps=nSteps)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        FPOut.load_trajectories()
+        extent = [-180, 180, -90, 90]
+        results = {}
+        for name, plot in [('Per release', lambda: legacy_plotMap_traj(
+                                FPOut, extent)),
+                           ('Collection', lambda: FPOut.plotMap_traj(
+                               extent=extent)),
+                           ('By height', lambda: FPOut.plotMap_traj(
+                               extent=extent, color='height'))]:
+            t0 = time.perf_counter()
+            fig = plot()[0]
+            fig.savefig(os.path.join(tmpDir, 'traj.png'))
+            dt = time.perf_counter()-t0
+            plt.close(fig)
+            # Tracing slows down the plot, measure the memory apart
+            tracemalloc.start()
+            plt.close(plot()[0])
+            peak = tracemalloc.get_traced_memory()[1]/2**20
+            tracemalloc.stop()
+            results[name] = (dt, peak)
+            print(f' {name:12}: {dt:8.3f} s, {peak:8.1f} MB peak')
+    return results
+
+
+def bench_folium(nReleases=2000, nSteps=24):
+    """
+    Time the creation of the folium map of the trajectories and
+    the size of its html, with one GeoJSON layer or one PolyLine
+    and Marker per release.
+    """
+    print(f'\n== Folium map ({nReleases} releases) ==')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_trajectories(os.path.join(tmpDir, 'trajectories.txt'),
+                           nReleases=nReleases, nSteps=nSteps)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        FPOut.load_trajectories()
+        for geojson in [False, True]:
+            tMap, m = timeit(FPOut.plotFoliumMap_traj, geojson=geojson)
+            htmlFile = os.path.join(tmpDir, 'map.html')
+            tHtml, _ = timeit(m.save, htmlFile)
+            size = os.path.getsize(htmlFile)/2**20
+            results[geojson] = (tMap+tHtml, size)
+            print(f' geojson={geojson!s:5}: {tMap+tHtml:8.3f} s, '
+                  + f'{size:8.1f} MB')
+    return results
+
+
+def bench_campaign(nRuns=16, nReleases=200, nSteps=24):
+    """
+    Time combining the trajectories of several runs one by one
+    ('combine_trajectories') and with 'FLEXPARTCampaign'.
+    """
+    print(f'\n== Campaign loading ({nRuns} runs) ==')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        runDirs = []
+        for i in range(nRuns):
+            runDir = os.path.join(tmpDir, f'run{i:03d}')
+            os.makedirs(runDir)
+            write_trajectories(os.path.join(runDir, 'trajectories.txt'),
+                               nReleases=nReleases, nSteps=nSteps)
+            runDirs.append(runDir)
+        FPOut = FLEXPARTOutput(runDirs[0]+'/')
+        tSerial, _ = timeit(FPOut.combine_trajectories, runDirs,
+                            os.path.join(tmpDir, 'serial'))
+        campaign = FLEXPARTCampaign(runDirs)
+        tCampaign, _ = timeit(campaign.combine_trajectories,
+                              os.path.join(tmpDir, 'campaign'))
+    print(f' Sequential: {tSerial:8.3f} s')
+    print(f' Campaign:   {tCampaign:8.3f} s ({os.cpu_count()} CPUs)')
+    return tSerial, tCampaign
+
+
+def bench_incremental(nRuns=20, nReleases=200, nSteps=24):
+    """
+    Time a full 'combine_trajectories' against updating the
+    processed files after adding one more run. The updated files
+    must be equal to the ones of a full combine, also after
+    changing the releases of a run, reordering and removing runs.
+    """
+    print(f'\n== Incremental combine ({nRuns} runs + 1) ==')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        runDirs = []
+        for i in range(nRuns+1):
+            runDir = os.path.join(tmpDir, f'run{i:03d}')
+            os.makedirs(runDir)
+            write_trajectories(os.path.join(runDir, 'trajectories.txt'),
+                               nReleases=nReleases, nSteps=nSteps)
+            runDirs.append(runDir)
+        FPOut = FLEXPARTOutput(runDirs[0]+'/')
+        saveDir = os.path.join(tmpDir, 'processed')
+        tFull, _ = timeit(FPOut.combine_trajectories, runDirs[:-1], saveDir)
+        tUpdate, _ = timeit(FPOut.combine_trajectories, runDirs, saveDir)
+
+        # == Compare with a full combine ========================
+        def combined(fmt, runs, saveDir, update):
+            outputDir = FPOut.combine_trajectories(runs, saveDir, fmt=fmt,
+                                                   update=update)
+            return [FPOut.read_table(f'{outputDir}/trajectories_{name}.'
+                                     + fmt)
+                    for name in ['data', 'metaData']]
+        def grow(runDir, n):
+            write_trajectories(os.path.join(runDir, 'trajectories.txt'),
+                               nReleases=n, nSteps=nSteps)
+        steps = [(runDirs[:3], None),
+                 # A run gets more releases
+                 (runDirs[:3], lambda: grow(runDirs[1], nReleases+2)),
+                 (runDirs[2::-1], None),
+                 (runDirs[:1], None)]
+        for fmt in sorted({'csv', FPOut.table_format()}):
+            updDir = os.path.join(tmpDir, f'update_{fmt}')
+            grow(runDirs[1], nReleases)
+            combined(fmt, runDirs[:2], updDir, True)
+            for runs, change in steps:
+                if change is not None:
+                    change()
+                update = combined(fmt, runs, updDir, True)
+                full = combined(fmt, runs, os.path.join(tmpDir, 'full'),
+                                False)
+                for dfUpdate, dfFull in zip(update, full):
+                    pd.testing.assert_frame_equal(dfUpdate, dfFull)
+    print(f' Full combine: {tFull:8.3f} s')
+    print(f' Update:       {tUpdate:8.3f} s')
+    return tFull, tUpdate
+
+
+def bench_plume_frames(nFrames=24, reuseMap=(False, True)):
+    """
+    Time the rendering of plume frames into a pdf, creating a
+    new map for every frame or reusing the same base map.
+    """
+    print(f'\n== plotMap_plume frames ({nFrames} frames) ==')
+    times = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_netcdf(os.path.join(tmpDir, 'grid_time_synthetic.nc'),
+                     nTimes=nFrames)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        FPOut.load_netcdf()
+        dates = FPOut.ncData.time.values
+        for reuse in reuseMap:
+            t0 = time.perf_counter()
+            with PdfPages(os.path.join(tmpDir, 'frames.pdf')) as pdf:
+                for date in dates:
+                    fig = FPOut.plotMap_plume(date, reuseMap=reuse)[0]
+                    pdf.savefig(fig, bbox_inches='tight')
+                    if not reuse:
+                        plt.close(fig)
+            times[reuse] = (time.perf_counter()-t0)/nFrames
+            print(f' reuseMap={reuse!s:5}: {times[reuse]*1000:8.1f} ms/frame')
+        plt.close('all')
+        FPOut.ncData.close()
+    return times
+
+
+def bench_release_selection(nReleases=200, nFrames=24, selected=(10, 11)):
+    """
+    Time plotting frames of all the releases against a few of
+    them, which only reads those releases from disk.
+    """
+    print(f'\n== Release selection ({len(selected)} of {nReleases} '
+          + 'releases) ==')
+    times = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_netcdf(os.path.join(tmpDir, 'grid_time_synthetic.nc'),
+                     nReleases=nReleases, nTimes=nFrames)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        FPOut.load_netcdf()
+        for releases in [None, list(selected)]:
+            t0 = time.perf_counter()
+            for date in FPOut.ncCoords['time']:
+                FPOut.plotMap_plume(date, releases=releases, reuseMap=True)
+            times[releases is None] = (time.perf_counter()-t0)/nFrames
+        plt.close('all')
+    print(f' All releases: {times[True]*1000:8.1f} ms/frame')
+    print(f' Selected:     {times[False]*1000:8.1f} ms/frame')
+    return times
+
+
+def bench_render(nFrames=12, nLat=300, nLon=300):
+    """
+    Compare the time per frame and the size of the pdf when the
+    plume is drawn with filled contours or as a raster, on a
+    fine grid.
+    """
+    print(f'\n== Plume render ({nFrames} frames, {nLat}x{nLon} grid) ==')
+    times = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_netcdf(os.path.join(tmpDir, 'grid_time_synthetic.nc'),
+                     nReleases=1, nTimes=nFrames, nHeights=1,
+                     nLat=nLat, nLon=nLon, zeros=0.5)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        FPOut.load_netcdf()
+        for render in ['contour', 'raster']:
+            pdfPath = os.path.join(tmpDir, f'{render}.pdf')
+            t0 = time.perf_counter()
+            with PdfPages(pdfPath) as pdf:
+                for date in FPOut.ncCoords['time']:
+                    fig = FPOut.plotMap_plume(date, reuseMap=True,
+                                              render=render)[0]
+                    pdf.savefig(fig, bbox_inches='tight')
+            times[render] = (time.perf_counter()-t0)/nFrames
+            print(f' {render:8}: {times[render]*1000:8.1f} ms/frame, '
+                  + f'{os.path.getsize(pdfPath)/1e6:6.2f} MB')
+        plt.close('all')
+        FPOut.ncData.close()
+    return times
+
+
+def bench_storage(nReleases=50, nTimes=48, nReads=50):
+    """
+    Compare the open time and the latency of reading random
+    frames (one time and height, summed over releases) from
+    netCDF and Zarr copies of the same data.
+    """
+    print(f'\n== Storage formats ({nReleases} releases, '
+          + f'{nTimes} times) ==')
+    rng = np.random.default_rng(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        ncFile = os.path.join(tmpDir, 'grid_time_synthetic.nc')
+        write_netcdf(ncFile, nReleases=nReleases, nTimes=nTimes)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        for fmt in ['nc', 'zarr']:
+            # Save the data in the required format
+            saveDir = os.path.join(tmpDir, fmt)
+            os.makedirs(saveDir)
+            FPOut.combine_netcdf([ncFile], saveDir, clean=False, fmt=fmt)
+            # Time the opening
+            tOpen, _ = timeit(FPOut.load_netcdf, saveDir+'/')
+            ds = FPOut.ncData
+            # Time random frames
+            frames = zip(rng.integers(0, nTimes, nReads),
+                         rng.integers(0, ds.height.size, nReads))
+            t0 = time.perf_counter()
+            for t, h in frames:
+                ds[0, :, t, h].sum(dim='pointspec').values
+            tRead = (time.perf_counter()-t0)/nReads
+            ds.close()
+            results[fmt] = (tOpen, tRead)
+        for fmt, (tOpen, tRead) in results.items():
+            print(f' {fmt:5}: open {tOpen*1000:8.1f} ms, '
+                  + f'random frame {tRead*1000:8.2f} ms')
+    return results
+
+
+def bench_footprint(nReleases=(4, 16)):
+    """
+    Integrate synthetic cubes of growing size (~124 MB per
+    release) with 'integrate_footprint' and report the time and
+    the peak of memory allocated, which should not grow with
+    the size of the file.
+    """
+    print('\n== integrate_footprint ==')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for n in nReleases:
+            runDir = os.path.join(tmpDir, f'run{n}')
+            os.makedirs(runDir)
+            ncFile = os.path.join(runDir, 'grid_time_synthetic.nc')
+            write_netcdf_large(ncFile, nReleases=n)
+            size = os.path.getsize(ncFile)/2**30
+            FPOut = FLEXPARTOutput(runDir+'/')
+            FPOut.load_netcdf()
+            tracemalloc.start()
+            tInt, _ = timeit(FPOut.integrate_footprint)
+            peak = tracemalloc.get_traced_memory()[1]/2**20
+            tracemalloc.stop()
+            FPOut.ncData.close()
+            os.remove(ncFile)
+            results[n] = (size, tInt, peak)
+        for n, (size, tInt, peak) in results.items():
+            print(f' {size:6.2f} GB: {tInt:8.1f} s, '
+                  + f'peak memory {peak:8.1f} MB')
+    return results
+
+
+def bench_binary_grid(nReleases=10, nTimes=24, zeros=0.9):
+    """
+    Compare loading a run and reading every frame (summed over
+    releases) from netCDF and from the binary sparse grid
+    files of the same data.
+    """
+    print(f'\n== Binary grids ({nReleases} releases, {nTimes} times) ==')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        ncDir = os.path.join(tmpDir, 'nc')
+        binDir = os.path.join(tmpDir, 'bin')
+        os.makedirs(ncDir)
+        os.makedirs(binDir)
+        ncFile = os.path.join(ncDir, 'grid_time_synthetic.nc')
+        write_netcdf(ncFile, nReleases=nReleases, nTimes=nTimes,
+                     zeros=zeros)
+        with xr.open_dataset(ncFile) as ds:
+            write_grid_binary(binDir, ds['spec001_mr'].load())
+        frames = {}
+        for fmt, outputDir, load in [('netCDF', ncDir, 'load_netcdf'),
+                                     ('binary', binDir, 'load_grid')]:
+            FPOut = FLEXPARTOutput(outputDir+'/')
+            t0 = time.perf_counter()
+            getattr(FPOut, load)()
+            frames[fmt] = FPOut.ncData[0].sum(dim='pointspec').values
+            results[fmt] = time.perf_counter()-t0
+            FPOut.ncData.close()
+        # Both must agree
+        np.testing.assert_allclose(frames['netCDF'], frames['binary'],
+                                   rtol=1e-6)
+        for fmt, t in results.items():
+            print(f' {fmt:7}: {t:8.3f} s')
+    return results
+
+
+def bench_traj_storage(nReleases=2000, nSteps=24, nSelect=10):
+    """
+    Compare the reload time of combined trajectories stored as
+    csv or parquet, reading every release or only a few of them.
+    """
+    print(f'\n== Trajectories storage ({nReleases} releases) ==')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        runDir = os.path.join(tmpDir, 'run')
+        os.makedirs(runDir)
+        write_trajectories(os.path.join(runDir, 'trajectories.txt'),
+                           nReleases=nReleases, nSteps=nSteps)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        releases = list(range(1, nReleases+1, nReleases//nSelect))
+        for fmt in sorted({'csv', FPOut.table_format()}):
+            saveDir = os.path.join(tmpDir, fmt)
+            outputDir = FPOut.combine_trajectories([runDir], saveDir,
+                                                   fmt=fmt)
+            tAll, _ = timeit(FPOut.load_trajectories, outputDir+'/')
+            tSel, _ = timeit(FPOut.load_trajectories, outputDir+'/',
+                             releases=releases, columns=['xcenter',
+                                                         'ycenter'])
+            results[fmt] = (tAll, tSel)
+        for fmt, (tAll, tSel) in results.items():
+            print(f' {fmt:8}: all {tAll:8.3f} s, '
+                  + f'{len(releases)} releases {tSel:8.3f} s')
+    return results
+
+
+def bench_receptors(nReceptors=20000, nTimes=720, nSelect=10):
+    """
+    Time extracting the series of a few receptors of a large
+    network from the memory-mapped 'receptor_conc' against
+    reading every record of the file.
+    """
+    print(f'\n== Receptors ({nReceptors} receptors, {nTimes} times) ==')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        write_output_dir(tmpDir, nReleases=1, nTimes=2, nHeights=1)
+        recFile = os.path.join(tmpDir, 'receptor_conc')
+        values = write_receptors(recFile, nReceptors=nReceptors,
+                                 nTimes=nTimes)
+        FPOut = FLEXPARTOutput(tmpDir+'/')
+        FPOut.load_header()
+        # Every record decoded, as a plain Fortran reader does
+        def read_all():
+            records = FPOut.read_records(recFile)
+            return np.array([np.frombuffer(r, dtype='<f4')
+                             for r in records[3::2]])
+        tRecords, full = timeit(read_all)
+        names = [f'R{i:06d}' for i in range(0, nReceptors,
+                                             nReceptors//nSelect)]
+        def series():
+            FPOut.load_receptors()
+            return FPOut.get_receptor_series(names)
+        tSeries, df = timeit(series)
+        # Both must agree
+        np.testing.assert_array_equal(full[:, ::nReceptors//nSelect],
+                                      values[:, 0, ::nReceptors//nSelect])
+        np.testing.assert_array_equal(df.values,
+                                      values[:, 0, ::nReceptors//nSelect])
+        FPOut.recData = None
+    print(f' Read all records:       {tRecords:8.3f} s')
+    print(f' Map, {nSelect} series:         {tSeries:8.3f} s')
+    return tRecords, tSeries
+
+
+def import_time(statement, repeat=3):
+    """
+    Return the best time in seconds of running 'statement' in a
+    new interpreter, as the sum of the cumulative times of the
+    top-level imports reported by 'python -X importtime'.
+    """
+    best = np.inf
+    for i in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                               statement], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True)
+        total = 0
+        for line in proc.stderr.splitlines():
+            fields = line.split('|')
+            # Nested imports are indented below their parent
+            if len(fields) == 3 and not fields[2].startswith('  '):
+                try:
+                    total += int(fields[1])
+                except ValueError:
+                    # Column titles
+                    continue
+        best = min(best, total/1e6)
+    return best
+
+
+def bench_import():
+    """
+    Compare the import time of FLEXPARTOutput alone, as done by
+    data processing jobs, with the import of the plotting stack
+    it used to load at startup.
+    """
+    print('\n== Import time ==')
+    plotting = ('import matplotlib.pyplot, cartopy.crs, seaborn, folium, '
+                + 'dask.diagnostics, matplotlib.backends.backend_pdf')
+    results = {'data': import_time('import FLEXPARTOutput'),
+               'plotting': import_time(f'import FLEXPARTOutput; {plotting}')}
+    print(f' Data only:     {results["data"]:8.3f} s')
+    print(f' With plotting: {results["plotting"]:8.3f} s')
+    print(f' Speedup:       {results["plotting"]/results["data"]:8.1f}x')
+    return results
+
+
+def bench_suite(nRuns=3, nReleases=10, nTimes=12, saveFile=None,
+                baseline=None, tolerance=1.2):
+    """
+    Time the main entry points of FLEXPARTOutput on synthetic
+    output directories ('write_output_dir'), as a reference to
+    spot performance regressions.
+
+    The timings (best of three calls for the cheap steps) are
+    saved as a CSV to 'saveFile' if given. If 'baseline' is the
+    CSV of a former run, every step is compared with it and the
+    ones slower by more than 'tolerance' times (and 10 ms) are
+    flagged.
+    """
+    print(f'\n== Suite ({nRuns} runs, {nReleases} releases, '
+          + f'{nTimes} times) ==')
+    times = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        runDirs = [write_output_dir(os.path.join(tmpDir, f'run{i:03d}'),
+                                    nReleases=nReleases, nTimes=nTimes,
+                                    nParticles=1000)
+                   for i in range(nRuns)]
+        # == Single run =========================================
+        FPOut = FLEXPARTOutput(runDirs[0]+'/')
+        times['load_trajectories'], _ = timeit(FPOut.load_trajectories,
+                                               repeat=3)
+        times['load_netcdf'], _ = timeit(FPOut.load_netcdf, repeat=3)
+        # Later calls return the cached header
+        times['load_header'], _ = timeit(FPOut.load_header)
+        times['load_partposit'], _ = timeit(FPOut.load_partposit,
+                                            repeat=3)
+        date = FPOut.ncCoords['time'][nTimes//2]
+        FPOut.plotMap_plume(date, reuseMap=True)
+        times['plotMap_plume'], _ = timeit(FPOut.plotMap_plume, date,
+                                           reuseMap=True, repeat=3)
+        times['plotPdfMap_plume'], _ = timeit(FPOut.plotPdfMap_plume,
+                                              'suite.pdf')
+        plt.close('all')
+        FPOut.ncData.close()
+        # == Several runs =======================================
+        saveDir = os.path.join(tmpDir, 'processed')
+        times['combine_trajectories'], _ = timeit(
+            FPOut.combine_trajectories, runDirs, saveDir, update=False)
+        times['reduce_netcdf'], files = timeit(
+            FPOut.reduce_netcdf, runDirs, saveDir, update=False)
+        times['combine_netcdf'], _ = timeit(FPOut.combine_netcdf, files,
+                                            saveDir)
+    results = pd.DataFrame({'seconds': pd.Series(times)})
+    # == Compare with a former run ==============================
+    if baseline:
+        former = pd.read_csv(baseline, index_col=0)['seconds']
+        results['baseline'] = former.reindex(results.index)
+        results['ratio'] = results['seconds']/results['baseline']
+        # Steps of a few milliseconds are too noisy to be flagged
+        results['regression'] = ((results['ratio'] > tolerance)
+                                 & (results['seconds']-results['baseline']
+                                    > 0.01))
+    print(results.to_string(float_format=lambda v: f'{v:8.3f}'))
+    if saveFile:
+        results[['seconds']].to_csv(saveFile)
+    return results
+# ===========================================================
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of FLEXPARTOutput on synthetic data.')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, without the "bench_" '
+                        + 'prefix (e.g. suite render). All by default')
+    parser.add_argument('--save', help='CSV to save the suite timings')
+    parser.add_argument('--baseline',
+                        help='CSV of former suite timings to compare with')
+    args = parser.parse_args()
+    benchmarks = {name[6:]: func for name, func in globals().items()
+                  if name.startswith('bench_')}
+    for name in args.benchmarks or benchmarks:
+        if name == 'suite':
+            bench_suite(saveFile=args.save, baseline=args.baseline)
+        else:
+            benchmarks[name]()